@@ -0,0 +1,60 @@
+"""
+Benchmark the AST and tokenize import scanners on large modules.
+
+Usage: python benchmarks/bench_imports.py [--functions 20000] [FILE ...]
+
+Without files, a synthetic module with imports spread through nested
+functions and try blocks is generated.
+"""
+import argparse
+import sys
+import time
+
+from miniogre.actions import IMPORT_SCANNERS
+
+
+def make_module(num_functions):
+    lines = ["import os", "from collections import abc"]
+    for i in range(num_functions):
+        lines.append(
+            "def f{0}(a, b=[1, 2, 3], *args, **kw):\n"
+            "    x = {{'a': a, 'b': b, 'text': f'{{a!r:>10}}'}}\n"
+            "    return [y * 2 for y in args if y] + list(kw)\n".format(i)
+        )
+        if i % 1000 == 0:
+            lines.append(
+                "try:\n    import mod{0}.sub as m\nexcept ImportError:\n"
+                "    from pkg{0} import (a,\n        b)\n".format(i)
+            )
+    return "\n".join(lines).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--functions", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.files:
+        sources = [(path, open(path, "rb").read()) for path in args.files]
+    else:
+        sources = [("synthetic", make_module(args.functions))]
+
+    print("python {}".format(sys.version.split()[0]))
+    for label, source in sources:
+        print("{} ({:.1f} MB)".format(label, len(source) / 1e6))
+        results = {}
+        for name, scan_imports in IMPORT_SCANNERS.items():
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results[name] = set(scan_imports(source))
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print("   {:<10} {:8.3f} s".format(name, best))
+        print("   same imports: {}".format(len({frozenset(r) for r in results.values()}) == 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark project scanning on a synthetic tree.
+
+Compares the original os.walk-based file listing with `scan_project`
+using a single thread and a thread pool.
+
+Usage: python benchmarks/bench_scan.py [--files 100000] [--workers 8] [--path DIR]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from miniogre.actions import scan_project
+
+
+def os_walk_list_files(project_path):
+    # File listing as done before scan_project existed
+    files = []
+    for root, dirs, filenames in os.walk(project_path):
+        if ".git" in dirs:
+            dirs.remove(".git")
+        if "__pycache__" in dirs:
+            dirs.remove("__pycache__")
+        for filename in filenames:
+            files.append(os.path.join(root, filename))
+    return files
+
+
+def os_walk_stat_files(project_path):
+    # os.walk plus the per-file stat that scan_project also does
+    files = os_walk_list_files(project_path)
+    return files, [os.stat(f) for f in files]
+
+
+def make_tree(root, num_files, files_per_dir=50, dirs_per_level=10):
+    # Spread files over a tree of nested directories
+    count = 0
+    queue = [root]
+    while count < num_files:
+        parent = queue.pop(0)
+        for d in range(dirs_per_level):
+            path = os.path.join(parent, "d{}".format(d))
+            os.makedirs(path, exist_ok=True)
+            queue.append(path)
+            for f in range(files_per_dir):
+                ext = ".py" if f % 3 == 0 else ".txt"
+                with open(os.path.join(path, "f{}{}".format(f, ext)), "w") as out:
+                    out.write("import os\n")
+                count += 1
+                if count >= num_files:
+                    return count
+    return count
+
+
+def timed(label, func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("{:<28} {:8.3f} s".format(label, best))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--path", default=None, help="scan an existing tree instead")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.path:
+        root = os.path.abspath(args.path)
+    else:
+        tmpdir = tempfile.mkdtemp(prefix="miniogre-bench-")
+        root = tmpdir
+        print("creating {} files in {}".format(make_tree(root, args.files), root))
+
+    try:
+        walked = timed("os.walk", lambda: os_walk_list_files(root))
+        timed("os.walk + stat", lambda: os_walk_stat_files(root))
+        serial = timed("scan_project (1 worker)", lambda: scan_project(root, workers=1))
+        parallel = timed(
+            "scan_project ({} workers)".format(args.workers),
+            lambda: scan_project(root, workers=args.workers),
+        )
+        print("same order: {}".format(walked == serial["files"] == parallel["files"]))
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
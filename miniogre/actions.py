@@ -1,19 +1,38 @@
 import json
 import ast
+import configparser
+import functools
 import glob
+import hashlib
+import io
+import mmap
 import os
 import platform
+import re
+import shutil
 import subprocess
 import tarfile
 import requests
 import uuid
+import sqlite3
 import sys
+import time
+import tokenize
 import importlib.metadata
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import Dict, List
 from string import Template
 from importlib.resources import files as importlib_files
 
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
 import emoji
 import google.generativeai as googleai
 import tiktoken
@@ -26,12 +45,19 @@ from pyfiglet import Figlet
 from rich import print as rprint
 from yaspin import yaspin
 
+from .config import config_cache_dir
 from .constants import *
 
 
 # Standard library modules (Python 3.10+)
 standard_libs = sys.stdlib_module_names if hasattr(sys, 'stdlib_module_names') else set()
 
+# Tokens that never matter when looking for import statements
+_IGNORED_TOKENS = {tokenize.ENCODING, tokenize.COMMENT, tokenize.NL}
+
+# IPython-only notebook lines: `%magic`, `!shell` and `x = !shell`
+_IPYTHON_LINE = re.compile(r"^\s*(?:[%!]|[\w.,\s]+=\s*[%!])")
+
 
 def starting_emoji():
     print(emoji.emojize(":ogre: Starting miniogre..."))
@@ -68,87 +94,475 @@ def eval_emoji():
     print(emoji.emojize(":magnifying_glass_tilted_left: Evaluating..."))
 
 
-def list_files(project_path):
-    # List all files in current directory and subdirectories
-    files = []
-    for root, dirs, filenames in os.walk(project_path):
-        if ".git" in dirs:
-            dirs.remove(".git")
-        if "__pycache__" in dirs:
-            dirs.remove("__pycache__")
-        for filename in filenames:
-            files.append(os.path.join(root, filename))
-    return files
+def _ignore_glob_to_regex(pattern):
+    """
+    Translate a single gitignore glob (without leading `!`, leading `/` or
+    trailing `/`) to a regular expression body.
+    """
+    out = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern[i:i + 3] == "**/":
+                # Zero or more leading directories
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern[i:i + 2] == "**":
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = pattern.find("]", i + 2)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                chars = pattern[i + 1:j].replace("\\", "\\\\")
+                if chars.startswith("!"):
+                    chars = "^" + chars[1:]
+                out.append("[{}]".format(chars))
+                i = j + 1
+                continue
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
 
 
-# Get file extensions
-def get_extensions(files):
-    extensions = [os.path.splitext(f)[1] for f in files]
-    return extensions
+def compile_ignore_rules(lines, base="", anchored=False):
+    """
+    Compile gitignore-style pattern lines into ignore rules.
 
+    Consecutive patterns of the same kind are merged into a single regular
+    expression, so a typical ignore file compiles to a handful of rules.
+    Each rule is a tuple (negate, dir_only, base, compiled_regex). Patterns
+    apply to paths relative to `base`. With `anchored`, every pattern is
+    matched from `base` (.dockerignore semantics).
+    """
+    rules = []
+    group_key = None
+    group = []
+
+    def flush():
+        if group:
+            negate, dir_only = group_key
+            regex = re.compile("(?:{})$".format("|".join(group)))
+            rules.append((negate, dir_only, base, regex))
+
+    for line in lines:
+        if not line.strip() or line.startswith("#"):
+            continue
+        line = line.rstrip()
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith("\\"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # A slash at the start or in the middle anchors the pattern
+        is_anchored = anchored or "/" in line
+        body = _ignore_glob_to_regex(line.lstrip("/"))
+        if not is_anchored:
+            body = "(?:.*/)?" + body
 
-# Count file extensions
-def count_extensions(extensions):
-    counts = {}
-    for ext in extensions:
-        if ext in counts:
-            counts[ext] += 1
-        else:
-            counts[ext] = 1
-    return counts
+        if (negate, dir_only) != group_key:
+            flush()
+            group_key = (negate, dir_only)
+            group = []
+        group.append(body)
+    flush()
+
+    return rules
 
 
-def ipynb_to_py(project_path, verbose=False):
+def load_ignore_matcher(project_path):
     """
-    Convert ipynb files (jupyter notebooks) to python scripts.
+    Build the ignore matcher for a project from DEFAULT_IGNORE_PATTERNS and
+    the .gitignore, .dockerignore and .miniogreignore files at its root.
+    Later files take precedence, so `!pattern` in .miniogreignore can
+    re-include something the other files exclude.
     """
+    matcher = compile_ignore_rules(DEFAULT_IGNORE_PATTERNS)
+    for ignore_file in IGNORE_FILES:
+        ignore_path = os.path.join(project_path, ignore_file)
+        if os.path.isfile(ignore_path):
+            lines = read_file_contents(ignore_path).splitlines()
+            matcher.extend(
+                compile_ignore_rules(lines, anchored=ignore_file == ".dockerignore")
+            )
+    return matcher
 
-    ipynbfiles = []
 
-    pattern_ipynb = glob.glob(
-        os.path.join("{}".format(project_path), "**/", "*.ipynb"),
-        recursive=True,
-    )
+def is_ignored(matcher, rel_path, is_dir):
+    """
+    Check a '/'-separated path relative to the project root against an
+    ignore matcher. The last matching rule wins, as in git.
+    """
+    for negate, dir_only, base, regex in reversed(matcher):
+        if dir_only and not is_dir:
+            continue
+        if base:
+            if not rel_path.startswith(base + "/"):
+                continue
+            path = rel_path[len(base) + 1:]
+        else:
+            path = rel_path
+        if regex.match(path):
+            return not negate
+    return False
 
-    if verbose:
-        stderr = None
-        progress = "plain"
+
+def scan_project(project_path, ogre_dir=None, matcher=None, workers=None):
+    """
+    Walk the project tree once with os.scandir and build an in-memory index
+    that every stage of the pipeline can query.
+
+    Files are listed in the same top-down order as os.walk. Returns a
+    dictionary in the format
+    {'root': str, 'files': [], 'dirs': {dir: [filenames]},
+     'by_ext': {ext: []}, 'readmes': [], 'notebooks': [],
+     'package_json': [], 'angular_json': [],
+     'stats': {path: (size, mtime_ns)}, 'hashes': {path: hash},
+     'lang_frame': dict or None, 'changed': bool}
+
+    When `ogre_dir` is given, the index saved there by `save_scan_index` is
+    reused: directories whose mtime did not change are not listed again,
+    and content hashes are kept for files whose size and mtime did not
+    change. The ogre_dir itself is never scanned.
+
+    Files and directories matched by `matcher` (by default the project's
+    .gitignore, .dockerignore and .miniogreignore rules, see
+    `load_ignore_matcher`) are left out, and ignored directories are never
+    descended into.
+
+    With `workers` > 1 (default: OGRE_SCAN_WORKERS), directories are listed
+    and stat'ed concurrently on a thread pool. The resulting index is the
+    same as with a single worker.
+    """
+    scan_started = time.time_ns()
+    previous = load_scan_index(project_path, ogre_dir) if ogre_dir else None
+    if previous:
+        prev_dirs = previous["dirs"]
+        prev_files = previous["files"]
+        # Entries touched shortly before the previous scan may have changed
+        # again within the filesystem timestamp granularity: never trust them.
+        trusted_before = previous["scanned_at"] - SCAN_INDEX_RACY_NS
     else:
-        stderr = subprocess.PIPE
-        progress = "auto"
+        prev_dirs, prev_files, trusted_before = {}, {}, 0
+    if matcher is None:
+        matcher = load_ignore_matcher(project_path)
+    if workers is None:
+        workers = int(os.getenv("OGRE_SCAN_WORKERS", SCAN_WORKERS))
+
+    scan_context = {
+        "project_path": project_path,
+        "skip_path": os.path.abspath(ogre_dir) if ogre_dir else None,
+        "prev_dirs": prev_dirs,
+        "trusted_before": trusted_before,
+    }
+    records = {}
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = {pool.submit(_scan_dir, scan_context, project_path, matcher)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = future.result()
+                    if record is None:
+                        continue
+                    records[record["root"]] = record
+                    for subdir in record["subdirs"]:
+                        pending.add(
+                            pool.submit(_scan_dir, scan_context, subdir, record["matcher"])
+                        )
+    else:
+        stack = [(project_path, matcher)]
+        while stack:
+            root, dir_matcher = stack.pop()
+            record = _scan_dir(scan_context, root, dir_matcher)
+            if record is None:
+                continue
+            records[root] = record
+            stack.extend((d, record["matcher"]) for d in reversed(record["subdirs"]))
+
+    index = {
+        "root": project_path,
+        "files": [],
+        "dirs": {},
+        "by_ext": {},
+        "readmes": [],
+        "notebooks": [],
+        "package_json": [],
+        "angular_json": [],
+        "stats": {},
+        "hashes": {},
+        "lang_frame": None,
+        "changed": previous is None,
+        "scanned_at": scan_started,
+        "dir_listings": {},
+    }
 
-    for filename in pattern_ipynb:
-        # subprocess to convert notebook to python
-        convert_cmd = 'jupyter nbconvert --to python "{}"'.format(filename)
-        p = subprocess.Popen(
-            convert_cmd, stdout=subprocess.PIPE, stderr=stderr, shell=True
-        )
-        (out, err) = p.communicate()
-        p_status = p.wait()
+    # Assemble the index in os.walk (pre-)order, whatever order the
+    # directories were scanned in
+    stack = [project_path]
+    while stack:
+        root = stack.pop()
+        record = records.get(root)
+        if record is None:
+            continue
+        if record["relisted"]:
+            index["changed"] = True
+        index["dir_listings"][root] = record["listing"]
+        index["dirs"][root] = []
+        rel_prefix = record["prefix"]
+        for filename, size, mtime in record["files"]:
+            file_path = _index_add(index, root, filename)
+            index["stats"][file_path] = (size, mtime)
+
+            # Keep the content hash if the file did not change since last scan
+            cached_file = prev_files.get(rel_prefix + filename) if prev_files else None
+            if (
+                cached_file
+                and cached_file[0] == size
+                and cached_file[1] == mtime
+                and mtime < trusted_before
+            ):
+                if cached_file[2]:
+                    index["hashes"][file_path] = cached_file[2]
+            else:
+                index["changed"] = True
+        stack.extend(reversed(record["subdirs"]))
 
-        filename_py = filename[:-5] + "py"
-        ipynbfiles.append(filename_py)
+    if len(index["files"]) != len(prev_files):
+        index["changed"] = True
+    if previous and not index["changed"]:
+        index["lang_frame"] = previous.get("lang_frame")
 
-    return ipynbfiles
+    return index
 
 
-def cleanup_converted_py(ipynb_to_py_list):
-    # Loop through the list and remove each file
-    if not ipynb_to_py_list:
-        print(
-            "There were no .ipynb files originally, so no .py files were generated. Nothing to clean up here."
-        )
+def _scan_dir(scan_context, root, matcher):
+    """
+    Scan a single directory for `scan_project`: list it (or reuse the
+    persisted listing), apply the ignore rules and stat the kept files.
+    Returns None if the directory cannot be read.
+    """
+    project_path = scan_context["project_path"]
+    rel_root = _relpath(root, project_path)
+    try:
+        dir_mtime = os.stat(root).st_mtime_ns
+    except OSError:
+        return None
+
+    cached = scan_context["prev_dirs"].get(rel_root)
+    relisted = not (
+        cached and cached[0] == dir_mtime and dir_mtime < scan_context["trusted_before"]
+    )
+    if relisted:
+        listing = _list_dir(root, scan_context["skip_path"])
+        if listing is None:
+            return None
+        filenames, subdir_names = listing
     else:
-        for file_path in ipynb_to_py_list:
-            try:
-                os.remove(file_path)
-                print(f"Removed: {file_path}")
-            except FileNotFoundError:
-                print(f"File not found: {file_path}. It can't be removed.")
-            except PermissionError:
-                print(f"Permission denied: {file_path}. It can't be removed.")
-            except Exception as e:
-                print(f"Error removing {file_path}: {e}")
+        # Directory listing did not change: reuse it
+        filenames, subdir_names = cached[1], cached[2]
+
+    rel_root = rel_root.replace(os.sep, "/")
+    # Nested .gitignore files apply to their own subtree
+    if root != project_path and ".gitignore" in filenames:
+        matcher = matcher + compile_ignore_rules(
+            read_file_contents(os.path.join(root, ".gitignore")).splitlines(),
+            base=rel_root,
+        )
+    prefix = "" if rel_root == "." else rel_root + "/"
+
+    files = []
+    root_prefix = os.path.join(root, "")
+    for filename in filenames:
+        if matcher and is_ignored(matcher, prefix + filename, False):
+            continue
+        try:
+            st = os.stat(root_prefix + filename)
+            files.append((filename, st.st_size, st.st_mtime_ns))
+        except OSError:
+            files.append((filename, 0, 0))
+
+    # Prune ignored directories
+    subdirs = [
+        os.path.join(root, d)
+        for d in subdir_names
+        if not (matcher and is_ignored(matcher, prefix + d, True))
+    ]
+
+    return {
+        "root": root,
+        "listing": (dir_mtime, filenames, subdir_names),
+        "relisted": relisted,
+        "prefix": prefix,
+        "files": files,
+        "subdirs": subdirs,
+        "matcher": matcher,
+    }
+
+
+def _list_dir(root, skip_path=None):
+    """
+    List a directory with os.scandir. Returns (filenames, subdir_names) or
+    None if the directory cannot be read.
+    """
+    filenames = []
+    subdir_names = []
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    # Do not follow symlinked directories, same as os.walk
+                    if (
+                        entry.name not in SCAN_SKIP_DIRS
+                        and not entry.is_symlink()
+                        and os.path.abspath(entry.path) != skip_path
+                    ):
+                        subdir_names.append(entry.name)
+                    continue
+                filenames.append(entry.name)
+    except OSError:
+        return None
+    return filenames, subdir_names
+
+
+def _relpath(path, project_path):
+    if path == project_path:
+        return "."
+    return path[len(project_path):].lstrip(os.sep)
+
+
+def load_scan_index(project_path, ogre_dir):
+    """
+    Load the scan index persisted in ogre_dir. Returns None if there is no
+    usable index (missing, corrupt, other version or other project root).
+    """
+    index_path = os.path.join(ogre_dir, SCAN_INDEX_FILE)
+    try:
+        with open(index_path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != SCAN_INDEX_VERSION or data.get("root") != project_path:
+        return None
+    return data
+
+
+def save_scan_index(index, ogre_dir):
+    """
+    Persist the project index in ogre_dir so the next scan is incremental.
+    Paths are stored relative to the project root to keep the file compact.
+    """
+    project_path = index["root"]
+    dirs = {}
+    for root, (dir_mtime, filenames, subdir_names) in index["dir_listings"].items():
+        dirs[_relpath(root, project_path)] = [dir_mtime, filenames, subdir_names]
+
+    files = {}
+    for file_path in index["files"]:
+        size, mtime = index["stats"][file_path]
+        files[_relpath(file_path, project_path)] = [
+            size, mtime, index["hashes"].get(file_path)
+        ]
+
+    data = {
+        "version": SCAN_INDEX_VERSION,
+        "root": project_path,
+        "scanned_at": index["scanned_at"],
+        "lang_frame": index["lang_frame"],
+        "dirs": dirs,
+        "files": files,
+    }
+    index_path = os.path.join(ogre_dir, SCAN_INDEX_FILE)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, index_path)
+
+    return index_path
+
+
+def content_hash(data):
+    """
+    Return the hex digest used to identify file contents.
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_hash(index, file_path):
+    """
+    Return the content hash of a file, reading it only if the index does not
+    already know it.
+    """
+    digest = index["hashes"].get(file_path)
+    if digest is None:
+        with open(file_path, "rb") as f:
+            digest = content_hash(f.read())
+        index["hashes"][file_path] = digest
+    return digest
+
+
+def _index_add(index, root, filename):
+    file_path = os.path.join(root, filename)
+    dot = filename.rfind(".")
+    # Same as os.path.splitext: leading dots do not start an extension
+    ext = filename[dot:] if dot > 0 and filename[:dot].strip(".") else ""
+    index["dirs"].setdefault(root, []).append(filename)
+    index["files"].append(file_path)
+    index["by_ext"].setdefault(ext, []).append(file_path)
+    if filename[:6].lower() == "readme":
+        index["readmes"].append(file_path)
+    if ext == ".ipynb":
+        index["notebooks"].append(file_path)
+    if filename == "package.json":
+        index["package_json"].append(file_path)
+    elif filename == "angular.json":
+        index["angular_json"].append(file_path)
+    return file_path
+
+
+def list_files(project_path, index=None):
+    # List all files in current directory and subdirectories
+    if index is None:
+        index = scan_project(project_path)
+    return list(index["files"])
+
+
+# Get file extensions
+def get_extensions(files):
+    extensions = [os.path.splitext(f)[1] for f in files]
+    return extensions
+
+
+# Count file extensions
+def count_extensions(extensions):
+    counts = {}
+    for ext in extensions:
+        if ext in counts:
+            counts[ext] += 1
+        else:
+            counts[ext] = 1
+    return counts
 
 
 # Get most prevalent extension for code files
@@ -157,11 +571,10 @@ def determine_most_ext(counts):
     return ".py"
 
 
-def find_readme(project_path):
-    files = list_files(project_path)
-    readme_files = [
-        f for f in files if os.path.basename(f).lower().startswith("readme")
-    ]
+def find_readme(project_path, index=None):
+    if index is None:
+        index = scan_project(project_path)
+    readme_files = index["readmes"]
 
     if readme_files:
         return readme_files[0]
@@ -180,19 +593,22 @@ def read_file_contents(path_to_file):
         else:
             return ""
 
-def walk_repo_and_return_contents(repo_path):
+def walk_repo_and_return_contents(repo_path, index=None):
     """
     Walk through a repository and return contents of source code files.
 
     Args:
         repo_path (str): Path to the repository.
+        index (dict): Optional project index returned by `scan_project`.
 
     Yields:
         tuple: A tuple containing the file path and its contents for source code files.
     """
     # List of file extensions corresponding to source code files
     source_code_extensions = sum(FILE_EXTENSIONS.values(), [])
-    for root, _, files in os.walk(repo_path):
+    if index is None:
+        index = scan_project(repo_path)
+    for root, files in index["dirs"].items():
         
         print("Comments will be generated for the following files:\n")
         for file in files:
@@ -292,75 +708,937 @@ def parse_imports(file_content: str) -> List[str]:
 
     return list(modules)
 
-def find_package_name(import_names: List[str]) -> Dict[str, str]:
-    package_mapping = {}
-    remaining_imports = set(import_names)  # Efficient lookup and removal
+def parse_imports_tokenize(file_content) -> List[str]:
+    """
+    Fast alternative to `parse_imports` that walks the token stream instead
+    of building a full AST. It finds the same modules, including imports
+    nested in functions and `try` blocks, and falls back to `parse_imports`
+    when it meets anything it does not understand.
+    """
+    try:
+        modules = _scan_import_tokens(file_content)
+    except (tokenize.TokenError, SyntaxError, StopIteration):
+        modules = None
+    if modules is None:
+        return parse_imports(file_content)
+    return list(modules)
 
-    # Check installed packages
-    for dist in importlib.metadata.distributions():
-        top_level_modules = dist.read_text('top_level.txt')
-        if top_level_modules is None:
-            continue
+def _scan_import_tokens(file_content):
+    # Returns the set of modules, or None if the token stream is ambiguous
+    if isinstance(file_content, bytes):
+        tokens = tokenize.tokenize(io.BytesIO(file_content).readline)
+    else:
+        tokens = tokenize.generate_tokens(io.StringIO(file_content).readline)
+    tokens = (tok for tok in tokens if tok.type not in _IGNORED_TOKENS)
 
-        top_level_modules = top_level_modules.splitlines()
-        for module in top_level_modules:
-            if module in remaining_imports:
-                package_mapping[module] = dist.metadata['Name']
-                remaining_imports.remove(module)
+    modules = set()
+    statement_start = True
+    depth = 0
+    for tok in tokens:
+        if tok.type == tokenize.NAME:
+            # `import`/`from` are hard keywords: at the start of a statement
+            # they can only begin an import
+            if statement_start and depth == 0 and tok.string in ("import", "from"):
+                if not _read_import_statement(tok.string, tokens, modules):
+                    return None
+                continue
+            statement_start = False
+        elif tok.type in (tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT):
+            statement_start = True
+        elif tok.type == tokenize.OP:
+            if tok.string in ("(", "[", "{"):
+                depth += 1
+            elif tok.string in (")", "]", "}"):
+                depth -= 1
+            # `;` separates statements, `:` ends a compound statement header
+            statement_start = depth == 0 and tok.string in (";", ":")
+        else:
+            statement_start = False
+    return modules
+
+def _read_dotted_name(tok, tokens):
+    # Returns (dotted_name, next_token); dotted_name is None if malformed
+    parts = []
+    while tok.type == tokenize.NAME:
+        parts.append(tok.string)
+        tok = next(tokens)
+        if tok.type != tokenize.OP or tok.string != ".":
+            return ".".join(parts), tok
+        tok = next(tokens)
+    return None, tok
+
+def _is_statement_end(tok):
+    return tok.type in (tokenize.NEWLINE, tokenize.ENDMARKER) or (
+        tok.type == tokenize.OP and tok.string == ";"
+    )
 
-        if not remaining_imports:
+def _read_import_statement(keyword, tokens, modules):
+    # Consume one import statement, adding its modules the same way
+    # `parse_imports` does. Returns False if the statement is not understood.
+    if keyword == "import":
+        while True:
+            name, tok = _read_dotted_name(next(tokens), tokens)
+            if not name:
+                return False
+            modules.add(name.split(".")[0])
+            if tok.type == tokenize.NAME and tok.string == "as":
+                if next(tokens).type != tokenize.NAME:
+                    return False
+                tok = next(tokens)
+            if tok.type == tokenize.OP and tok.string == ",":
+                continue
+            return _is_statement_end(tok)
+
+    tok = next(tokens)
+    # Relative imports: `from . import x`, `from ..pkg import x`
+    while tok.type == tokenize.OP and tok.string in (".", "..."):
+        tok = next(tokens)
+    module = ""
+    if tok.type == tokenize.NAME and tok.string != "import":
+        module, tok = _read_dotted_name(tok, tokens)
+        if not module:
+            return False
+    if tok.type != tokenize.NAME or tok.string != "import":
+        return False
+
+    # Skip the imported names, which may be wrapped in parentheses
+    depth = 0
+    for tok in tokens:
+        if tok.type == tokenize.OP and tok.string == "(":
+            depth += 1
+        elif tok.type == tokenize.OP and tok.string == ")":
+            depth -= 1
+        elif depth == 0 and _is_statement_end(tok):
             break
 
-    # Check remaining imports if they're standard libraries; if not, query PyPI
+    if module:
+        module_base = module.split(".")[0]
+        if module_base == "google" and module.startswith("google.cloud"):
+            modules.add("google.cloud")
+        else:
+            modules.add(module_base)
+    return True
+
+def notebook_code_cells(file_content):
+    """
+    Return the source of the code cells of a Jupyter notebook, without
+    IPython `%magic`, `!shell` and `x = !shell` lines, so it can be parsed
+    as Python.
+    """
+    notebook = json.loads(file_content)
+    cells = notebook.get("cells")
+    if cells is None:
+        # nbformat 3 keeps cells in worksheets
+        cells = [c for ws in notebook.get("worksheets", []) for c in ws.get("cells", [])]
+
+    code_cells = []
+    for cell in cells:
+        if cell.get("cell_type") != "code":
+            continue
+        source = cell.get("source", cell.get("input", ""))
+        if isinstance(source, list):
+            source = "".join(source)
+        lines = [
+            line for line in source.splitlines() if not _IPYTHON_LINE.match(line)
+        ]
+        code_cells.append("\n".join(lines))
+    return code_cells
+
+def parse_notebook_imports(file_content, scan_imports=parse_imports) -> List[str]:
+    """
+    Extract the imports of a Jupyter notebook in memory. If the joined code
+    cells do not parse (e.g. `x = !ls`), cells are parsed one by one and the
+    broken ones are skipped.
+    """
+    code_cells = notebook_code_cells(file_content)
+    try:
+        return scan_imports("\n".join(code_cells))
+    except SyntaxError:
+        modules = set()
+        for cell in code_cells:
+            try:
+                modules.update(scan_imports(cell))
+            except SyntaxError:
+                continue
+        return list(modules)
+
+def open_import_cache(ogre_dir):
+    """
+    Open the SQLite cache in ogre_dir that maps file content hashes to the
+    imports found by each import scanner, or the error for files that could
+    not be parsed, creating it if needed. The cache is emptied when
+    IMPORT_CACHE_VERSION changes.
+    """
+    conn = sqlite3.connect(os.path.join(ogre_dir, IMPORT_CACHE_FILE))
+    if conn.execute("PRAGMA user_version").fetchone()[0] != IMPORT_CACHE_VERSION:
+        conn.execute("DROP TABLE IF EXISTS imports")
+        conn.execute("PRAGMA user_version = {}".format(IMPORT_CACHE_VERSION))
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS imports ("
+        "hash TEXT NOT NULL, scanner TEXT NOT NULL, modules TEXT NOT NULL, "
+        "error TEXT, PRIMARY KEY (hash, scanner))"
+    )
+    return conn
+
+def cached_imports(conn, digest, import_scanner="ast"):
+    """
+    Return the cached (import list, parse error or None) for a content hash
+    and import scanner, or None on a miss.
+    """
+    row = conn.execute(
+        "SELECT modules, error FROM imports WHERE hash = ? AND scanner = ?", (digest, import_scanner)
+    ).fetchone()
+    if row is None:
+        return None
+    return (row[0].split("\n") if row[0] else []), row[1]
+
+def store_imports(conn, entries, import_scanner="ast"):
+    """
+    Store (content_hash, (import_list, error)) pairs found by an import
+    scanner in the import cache. error is None for files parsed cleanly.
+    """
+    conn.executemany(
+        "INSERT OR REPLACE INTO imports (hash, scanner, modules, error) VALUES (?, ?, ?, ?)",
+        [(digest, import_scanner, "\n".join(sorted(modules)), error)
+         for digest, (modules, error) in entries],
+    )
+    conn.commit()
+
+def _parse_import_batch(file_paths, import_scanner="ast"):
+    """
+    Read and parse a batch of files with the given import scanner (see
+    IMPORT_SCANNERS). Runs in a worker process when imports are extracted
+    with more than one job.
+
+    Returns a list of (file_path, content_hash, imports, error) tuples, where
+    imports is None and error is set if the file could not be read or parsed
+    (e.g. a SyntaxError in a Python 2 file).
+    """
+    scan_imports = IMPORT_SCANNERS[import_scanner]
+    results = []
+    for file_path in file_paths:
+        try:
+            with open(file_path, "rb") as f:
+                file_bytes = f.read()
+        except OSError as e:
+            results.append((file_path, None, None, str(e)))
+            continue
+        digest = content_hash(file_bytes)
+        try:
+            if file_path.endswith(".ipynb"):
+                import_names = parse_notebook_imports(file_bytes, scan_imports)
+            else:
+                # Bytes are decoded honouring PEP 263 coding cookies
+                import_names = scan_imports(file_bytes)
+            results.append((file_path, digest, import_names, None))
+        except (SyntaxError, ValueError) as e:
+            results.append((file_path, digest, None, "{}: {}".format(type(e).__name__, e)))
+    return results
+
+def parse_files_imports(file_paths, jobs=1, import_scanner="ast"):
+    """
+    Parse the imports of a list of files, in `jobs` worker processes if
+    jobs > 1. Files are sent to the workers in batches to keep pickling
+    overhead low. Results are returned in the order of `file_paths`, in the
+    format of `_parse_import_batch`.
+    """
+    if import_scanner not in IMPORT_SCANNERS:
+        raise ValueError("Invalid import scanner: {}".format(import_scanner))
+    if jobs <= 1 or len(file_paths) < 2:
+        return _parse_import_batch(file_paths, import_scanner)
+
+    batch_size = max(1, min(IMPORT_PARSE_MAX_BATCH, len(file_paths) // (jobs * 4)))
+    batches = [
+        file_paths[i:i + batch_size] for i in range(0, len(file_paths), batch_size)
+    ]
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        parse_batch = functools.partial(_parse_import_batch, import_scanner=import_scanner)
+        for batch_results in pool.map(parse_batch, batches):
+            results.extend(batch_results)
+    return results
+
+# Import scanners selectable with --import-scanner
+IMPORT_SCANNERS = {
+    "ast": parse_imports,
+    "tokenize": parse_imports_tokenize,
+}
+
+def _site_packages_fingerprint():
+    # Installing or removing a distribution changes the mtime of the
+    # directory it is installed in
+    h = hashlib.blake2b(digest_size=16)
+    for path in sys.path:
+        if path and os.path.isdir(path):
+            h.update("{}:{}\n".format(path, os.stat(path).st_mtime_ns).encode())
+    return h.hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def open_package_map():
+    """
+    Memory-map the bundled import name -> package name table. Returns
+    (mmap, offset of the first entry), or None if the table is missing or
+    has an unsupported version.
+    """
+    map_path = importlib_files("miniogre").joinpath(PACKAGE_MAP_DIR, PACKAGE_MAP_FILE)
+    try:
+        with open(str(map_path), "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    header_end = mm.find(b"\n")
+    fields = mm[:header_end].split(b"\t")
+    if len(fields) < 2 or fields[0] != b"#miniogre-package-map" or fields[1] != str(PACKAGE_MAP_VERSION).encode():
+        mm.close()
+        return None
+    return mm, header_end + 1
+
+def lookup_package_map(module_name: str) -> str:
+    """
+    Binary search the bundled package map for a top-level import name.
+    Returns the PyPI package name, or None if the name is not in the table.
+    """
+    package_map = open_package_map()
+    if package_map is None:
+        return None
+    mm, lo = package_map
+    hi = len(mm)
+    key = module_name.encode("utf-8")
+    # lo and hi always point at the start of a line
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = mm.rfind(b"\n", lo, mid) + 1 or lo
+        end = mm.find(b"\n", start, hi)
+        if end == -1:
+            end = hi
+        line_key, _, package = mm[start:end].partition(b"\t")
+        if line_key == key:
+            return package.decode("utf-8")
+        if line_key < key:
+            lo = end + 1
+        else:
+            hi = start
+    return None
+
+def write_package_map(mapping: Dict[str, str], map_path: str):
+    """
+    Write an import name -> package name mapping in the bundled table
+    format: a version header followed by lines sorted by import name.
+    """
+    lines = sorted(
+        (module.encode("utf-8"), package.encode("utf-8"))
+        for module, package in mapping.items()
+        if module and package
+    )
+    with open(map_path, "wb") as f:
+        f.write(b"#miniogre-package-map\t%d\n" % PACKAGE_MAP_VERSION)
+        for module, package in lines:
+            f.write(module + b"\t" + package + b"\n")
+
+@functools.lru_cache(maxsize=None)
+def load_module_index() -> Dict[str, str]:
+    """
+    Return the mapping of top-level importable module names to the name of
+    the installed distribution providing them.
+
+    The mapping comes from importlib.metadata.packages_distributions, which
+    reads top_level.txt and falls back to the RECORD file of each
+    distribution. It is built at most once per process and persisted in
+    the cache dir, keyed by a fingerprint of the sys.path directories, so
+    it is only rebuilt after packages are installed or removed.
+    """
+    fingerprint = _site_packages_fingerprint()
+    index_path = os.path.join(config_cache_dir(), MODULE_INDEX_FILE)
+    try:
+        with open(index_path, "r") as f:
+            data = json.load(f)
+        if data.get("fingerprint") == fingerprint:
+            return data["modules"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    modules = {}
+    for module, dist_names in importlib.metadata.packages_distributions().items():
+        # Keep the first distribution found, like a sys.path lookup would
+        if module and dist_names and "/" not in module:
+            modules[module] = dist_names[0]
+
+    tmp_path = index_path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump({"fingerprint": fingerprint, "modules": modules}, f, separators=(",", ":"))
+        os.replace(tmp_path, index_path)
+    except OSError:
+        # Read-only or missing cache dir: rebuild the index next time
+        pass
+
+    return modules
+
+def find_package_name(import_names: List[str]) -> Dict[str, str]:
+    package_mapping = {}
+    remaining_imports = set(import_names)  # Efficient lookup and removal
+
+    # Check installed packages
+    module_index = load_module_index()
+    for module in import_names:
+        if module in module_index:
+            package_mapping[module] = module_index[module]
+            remaining_imports.discard(module)
+
+    # Check remaining imports if they're standard libraries or in the bundled
+    # package map; if not, query PyPI
+    unknown_imports = []
     for name in remaining_imports:
         if name in standard_libs:
             package_mapping[name] = None  # Standard library, no package needed
+            continue
+        package = lookup_package_map(name)
+        if package is not None:
+            package_mapping[name] = package
         else:
-            package_mapping[name] = query_pypi(name)
+            unknown_imports.append(name)
+    package_mapping.update(query_pypi_many(unknown_imports))
 
     return package_mapping
 
-def query_pypi(module_name: str) -> str:
+def package_index():
+    """
+    Return the configured package index as (backend, location).
+
+    - "simple": PEP 691 JSON simple API at OGRE_INDEX_URL (PyPI or a
+      custom/internal index such as devpi or a proxy).
+    - "local": directory mirror with the PEP 503 simple layout (e.g. a
+      bandersnatch mirror). Selected when OGRE_INDEX_URL is a path or a
+      file:// URL.
+    - "json": legacy PyPI JSON API at OGRE_PYPI_URL.
+    """
+    backend = os.getenv("OGRE_INDEX_BACKEND", PACKAGE_INDEX_BACKEND)
+    if backend == "json":
+        return backend, os.getenv("OGRE_PYPI_URL", PYPI_URL).rstrip("/")
+    if backend not in PACKAGE_INDEX_BACKENDS:
+        raise ValueError(
+            "Invalid index backend: {}. Choose from: {}".format(backend, ", ".join(PACKAGE_INDEX_BACKENDS))
+        )
+
+    url = os.getenv("OGRE_INDEX_URL", PACKAGE_INDEX_URL).rstrip("/")
+    if url.startswith("file://"):
+        backend, url = "local", url[len("file://"):]
+    elif "://" not in url:
+        backend = "local"
+    if backend == "local":
+        path = os.path.abspath(os.path.expanduser(url))
+        # A bandersnatch mirror root keeps the simple index under web/simple
+        if os.path.isdir(os.path.join(path, "web", "simple")):
+            path = os.path.join(path, "web", "simple")
+        return backend, path
+    return backend, url
+
+def index_url_for_uv():
+    """
+    Return the index URL uv should resolve against, or None for the
+    default PyPI index.
+    """
+    backend, location = package_index()
+    if backend == "local":
+        return Path(location).as_uri()
+    if backend == "json":
+        location = location + "/simple"
+    if location.rstrip("/") == PACKAGE_INDEX_URL:
+        return None
+    return location
+
+def normalize_package_name(name: str) -> str:
+    # PEP 503 name normalization
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+def query_pypi(module_name: str, session=None, timeout=None) -> str:
     """
-    Query PyPI to check if a module name is a valid package name.
-    If found, return the package name; otherwise, return None.
+    Query the package index to check if a module name is a valid package
+    name. If found, return the package name; otherwise, return None.
     """
-    url = f"https://pypi.org/pypi/{module_name}/json"
+    backend, location = package_index()
+    if backend == "local":
+        found = os.path.isdir(os.path.join(location, normalize_package_name(module_name)))
+        return module_name if found else None
+    entry = _pypi_lookup(module_name, session, timeout, index=(backend, location))
+    if entry and entry["found"]:
+        return module_name
+    return None  # Not found on the index
+
+def _pypi_lookup(module_name, session=None, timeout=None, cached_entry=None, index=None):
+    # Returns a cache entry {"found", "checked", "etag", "last_modified"},
+    # or None if the index could not be reached. A cached entry is
+    # revalidated with If-None-Match / If-Modified-Since.
+    backend, location = index if index is not None else package_index()
+    if timeout is None:
+        timeout = float(os.getenv("OGRE_PYPI_TIMEOUT", PYPI_TIMEOUT))
+    headers = {}
+    if cached_entry:
+        if cached_entry.get("etag"):
+            headers["If-None-Match"] = cached_entry["etag"]
+        if cached_entry.get("last_modified"):
+            headers["If-Modified-Since"] = cached_entry["last_modified"]
+    http = session if session is not None else requests
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return module_name
+        if backend == "json":
+            response = http.get(f"{location}/pypi/{module_name}/json", headers=headers, timeout=timeout)
+        else:
+            # Only the status matters: ask for the project page headers
+            url = f"{location}/{normalize_package_name(module_name)}/"
+            headers["Accept"] = SIMPLE_API_ACCEPT
+            response = http.head(url, headers=headers, timeout=timeout, allow_redirects=True)
+            if response.status_code == 405:
+                response = http.get(url, headers=headers, timeout=timeout)
     except requests.RequestException:
+        return None
+
+    if response.status_code == 304 and cached_entry:
+        return dict(cached_entry, checked=time.time())
+    if response.status_code >= 500:
+        return None
+    return {
+        "found": response.status_code == 200,
+        "checked": time.time(),
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+def load_pypi_cache():
+    """
+    Load the package index lookup cache from the cache dir. Returns a
+    dictionary {"backend:location": {module_name: entry}}.
+    """
+    cache_path = os.path.join(config_cache_dir(), PYPI_CACHE_FILE)
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_pypi_cache(cache):
+    cache_path = os.path.join(config_cache_dir(), PYPI_CACHE_FILE)
+    tmp_path = cache_path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, separators=(",", ":"))
+        os.replace(tmp_path, cache_path)
+    except OSError:
         pass
-    return None  # Not found on PyPI
 
-def extract_requirements_from_code(project_path, ext, generate=True, verbose=False):
+def query_pypi_many(module_names: List[str]) -> Dict[str, str]:
+    """
+    Query the package index for several module names concurrently, over a
+    single pooled HTTP session with at most OGRE_PYPI_CONCURRENCY requests
+    in flight. Returns a dictionary {module_name: package name or None}.
+
+    Results are cached on disk per index: names found are trusted for
+    OGRE_PYPI_CACHE_TTL seconds and names not found for
+    OGRE_PYPI_CACHE_NEGATIVE_TTL seconds. Expired entries are revalidated
+    with their ETag/Last-Modified. Failed requests are not cached. Local
+    mirrors are checked directly on disk.
+    """
+    module_names = list(dict.fromkeys(module_names))
+    if not module_names:
+        return {}
+
+    backend, location = package_index()
+    if backend == "local":
+        return {name: query_pypi(name) for name in module_names}
+
+    ttl = float(os.getenv("OGRE_PYPI_CACHE_TTL", PYPI_CACHE_TTL))
+    negative_ttl = float(os.getenv("OGRE_PYPI_CACHE_NEGATIVE_TTL", PYPI_CACHE_NEGATIVE_TTL))
+    cache = load_pypi_cache()
+    index_cache = cache.setdefault("{}:{}".format(backend, location), {})
+
+    results = {}
+    to_query = []
+    now = time.time()
+    for name in module_names:
+        entry = index_cache.get(name)
+        if entry and now - entry["checked"] < (ttl if entry["found"] else negative_ttl):
+            results[name] = name if entry["found"] else None
+        else:
+            to_query.append(name)
+    if not to_query:
+        return results
+
+    concurrency = int(os.getenv("OGRE_PYPI_CONCURRENCY", PYPI_CONCURRENCY))
+    workers = max(1, min(concurrency, len(to_query)))
+    timeout = float(os.getenv("OGRE_PYPI_TIMEOUT", PYPI_TIMEOUT))
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            entries = list(pool.map(
+                lambda name: _pypi_lookup(name, session, timeout, index_cache.get(name), (backend, location)),
+                to_query,
+            ))
+
+    for name, entry in zip(to_query, entries):
+        if entry is None:
+            results[name] = None
+            continue
+        index_cache[name] = entry
+        results[name] = name if entry["found"] else None
+    save_pypi_cache(cache)
 
-    requirements_emoji()
+    return results
 
-    if generate:
-        files = list_files(project_path)
-        matching = [f for f in files if os.path.splitext(f)[1] == ext]
+def collect_project_imports(project_path, ext, index=None, ogre_dir=None, jobs=1, import_scanner="ast", verbose=False):
+    """
+    First stage of requirements extraction: collect the deduplicated union
+    of top-level imports across the project.
 
-        external_imports = []
-        for filename in matching:
-            with open(filename, 'r') as file:
-                file_content = file.read()
-            # Parse imports from the file content
-            import_names = parse_imports(file_content)
-            # Find the packages for each import
-            package_mapping = find_package_name(import_names)
-            # Filter out None values (standard libraries) and display the necessary packages
-            necessary_packages = {k: v for k, v in package_mapping.items() if v is not None}
-            package_list = list(necessary_packages.values())
+    Returns a dictionary {module: [files importing it]}.
+    """
+    if index is None:
+        index = scan_project(project_path)
+    matching = index["by_ext"].get(ext, [])
+    if ext == ".py":
+        # Notebooks are read in place, without converting them to .py
+        matching = matching + index["notebooks"]
+
+    # Imports (and parse errors) are cached by file content hash, so only
+    # new or modified files are parsed again
+    import_cache = open_import_cache(ogre_dir) if ogre_dir else None
+    imports_by_file = {}
+    to_parse = []
+    for filename in matching:
+        digest = index["hashes"].get(filename)
+        if digest and import_cache:
+            cached = cached_imports(import_cache, digest, import_scanner)
+            if cached is not None:
+                import_names, error = cached
+                if error is None:
+                    imports_by_file[filename] = import_names
+                elif verbose:
+                    print(f"> skipping {filename}: {error} (cached)")
+                continue
+        to_parse.append(filename)
+
+    new_cache_entries = {}
+    for filename, digest, import_names, error in parse_files_imports(to_parse, jobs, import_scanner):
+        if digest:
+            index["hashes"][filename] = digest
+        if error:
+            print(f"Skipping {filename}: {error}")
+            if digest:
+                new_cache_entries[digest] = ([], error)
+            continue
+        imports_by_file[filename] = import_names
+        new_cache_entries[digest] = (import_names, None)
+
+    if import_cache:
+        store_imports(import_cache, new_cache_entries.items(), import_scanner)
+        import_cache.close()
+    if verbose:
+        print(f"> parsed {len(to_parse)} of {len(matching)} files, the rest came from the import cache")
+
+    import_sources = {}
+    for filename in matching:
+        for module in imports_by_file.get(filename, []):
+            import_sources.setdefault(module, []).append(filename)
+    return import_sources
+
+def resolve_imports(import_sources, verbose=False) -> Dict[str, str]:
+    """
+    Second stage of requirements extraction: resolve every collected import
+    to a package name once, however many files import it.
+
+    Returns a dictionary {module: package}, without standard library
+    modules and imports that could not be resolved.
+    """
+    package_mapping = find_package_name(list(import_sources))
+    # Filter out None values (standard libraries and unknown modules)
+    necessary_packages = {k: v for k, v in package_mapping.items() if v is not None}
+    if verbose:
+        for module in sorted(package_mapping):
+            print(f"> {module} -> {package_mapping[module]} ({len(import_sources[module])} files)")
+    return necessary_packages
+
+def first_party_modules(project_path, index=None) -> set:
+    """
+    Return the top-level module names that belong to the project itself, so
+    they are not resolved as third-party packages: top-level packages
+    (outermost directories with __init__.py), modules at the project root
+    or under src/, and packages declared in pyproject.toml.
+    """
+    if index is None:
+        index = scan_project(project_path)
+    dirs = index["dirs"]
+    source_roots = {index["root"], os.path.join(index["root"], "src")}
+
+    modules = set()
+    for root, filenames in dirs.items():
+        if "__init__.py" in filenames:
+            # Only the outermost package is a top-level name
+            if "__init__.py" not in dirs.get(os.path.dirname(root), ()):
+                modules.add(os.path.basename(root))
+        if root in source_roots:
+            for filename in filenames:
+                name, _, ext = filename.partition(".")
+                if ext.rsplit(".", 1)[-1] in FIRST_PARTY_EXTENSIONS:
+                    modules.add(name)
+
+    modules.update(pyproject_packages(index["root"]))
+    return {module for module in modules if module.isidentifier()}
+
+def pyproject_packages(project_path) -> set:
+    """
+    Return the top-level packages declared in the project's pyproject.toml
+    (PEP 621 name, setuptools, poetry, hatch and flit settings).
+    """
+    pyproject = load_toml(os.path.join(project_path, "pyproject.toml"))
+    if not pyproject:
+        return set()
+
+    tool = pyproject.get("tool", {})
+    setuptools = tool.get("setuptools", {})
+    poetry = tool.get("poetry", {})
+    dotted = []  # dotted module names, e.g. "pkg.sub"
+    paths = []  # package paths, e.g. "src/pkg"
+
+    for name in (pyproject.get("project", {}).get("name"), poetry.get("name")):
+        if name:
+            dotted.append(re.sub(r"[-.]+", "_", name).lower())
+    if isinstance(setuptools.get("packages"), list):
+        dotted += setuptools["packages"]
+    dotted += setuptools.get("py-modules", [])
+    for package in poetry.get("packages", []):
+        if isinstance(package, dict) and "include" in package:
+            dotted.append(package["include"].replace("/", "."))
+    dotted.append(tool.get("flit", {}).get("module", {}).get("name"))
+    wheel = tool.get("hatch", {}).get("build", {}).get("targets", {}).get("wheel", {})
+    paths += wheel.get("packages", [])
+
+    packages = {name.split(".")[0] for name in dotted if isinstance(name, str) and name}
+    packages.update(os.path.basename(path.rstrip("/")) for path in paths if isinstance(path, str))
+    return packages
+
+def load_toml(toml_path):
+    """
+    Parse a TOML file. Returns None if it is missing, cannot be parsed or
+    no TOML parser is available.
+    """
+    if tomllib is None or not os.path.isfile(toml_path):
+        return None
+    try:
+        with open(toml_path, "rb") as f:
+            return tomllib.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not parse {toml_path}: {e}")
+        return None
+
+def _poetry_constraint(constraint):
+    # Convert a poetry version constraint (^1.2, ~1.2, 1.2, >=1,<2, *) to
+    # a PEP 440 specifier
+    constraint = constraint.strip()
+    if constraint in ("", "*"):
+        return ""
+    if constraint[0] in "^~" and not constraint.startswith("~="):
+        version = constraint[1:].strip()
+        parts = [int(part) if part.isdigit() else 0 for part in version.split(".")]
+        if constraint[0] == "^":
+            # Bump the first non-zero component (or the last one given)
+            bump = next((i for i, part in enumerate(parts) if part), len(parts) - 1)
+        else:
+            bump = min(1, len(parts) - 1)
+        upper = parts[:bump] + [parts[bump] + 1]
+        return ">={},<{}".format(version, ".".join(str(part) for part in upper))
+    if constraint[0].isdigit():
+        return "==" + constraint
+    return constraint.replace(" ", "")
+
+def _poetry_requirement(name, spec):
+    # Convert a [tool.poetry.dependencies] entry to a requirement line
+    if isinstance(spec, list):
+        spec = spec[0] if spec else "*"
+    if isinstance(spec, str):
+        return name + _poetry_constraint(spec)
+    if "git" in spec:
+        ref = spec.get("rev") or spec.get("tag") or spec.get("branch")
+        return "{} @ git+{}".format(name, spec["git"]) + ("@" + ref if ref else "")
+    if "url" in spec:
+        return "{} @ {}".format(name, spec["url"])
+    if "path" in spec:
+        return None  # local path dependencies are part of the project
+    extras = "[{}]".format(",".join(spec["extras"])) if spec.get("extras") else ""
+    requirement = name + extras + _poetry_constraint(spec.get("version", "*"))
+    if spec.get("markers"):
+        requirement += "; " + spec["markers"]
+    return requirement
+
+def manifest_dependencies(project_path):
+    """
+    Read the direct dependencies declared in the project's manifests, in
+    order of preference: pyproject.toml (PEP 621 or poetry), setup.cfg and
+    Pipfile.lock. Returns (manifest name, list of requirement lines), or
+    (None, None) if no manifest declares dependencies.
+    """
+    pyproject = load_toml(os.path.join(project_path, "pyproject.toml"))
+    if pyproject:
+        dependencies = pyproject.get("project", {}).get("dependencies")
+        if dependencies:
+            return "pyproject.toml", list(dependencies)
+        poetry_dependencies = pyproject.get("tool", {}).get("poetry", {}).get("dependencies", {})
+        requirements = [
+            _poetry_requirement(name, spec)
+            for name, spec in poetry_dependencies.items()
+            if name.lower() != "python"
+        ]
+        requirements = [requirement for requirement in requirements if requirement]
+        if requirements:
+            return "pyproject.toml", requirements
+
+    setup_cfg_path = os.path.join(project_path, "setup.cfg")
+    if os.path.isfile(setup_cfg_path):
+        setup_cfg = configparser.ConfigParser(interpolation=None)
+        try:
+            setup_cfg.read(setup_cfg_path)
+            install_requires = setup_cfg.get("options", "install_requires", fallback="")
+        except configparser.Error as e:
+            print(f"Could not parse {setup_cfg_path}: {e}")
+            install_requires = ""
+        requirements = [
+            line.split("#")[0].strip() for line in install_requires.splitlines()
+            if line.split("#")[0].strip()
+        ]
+        if requirements:
+            return "setup.cfg", requirements
+
+    pipfile_lock_path = os.path.join(project_path, "Pipfile.lock")
+    if os.path.isfile(pipfile_lock_path):
+        try:
+            with open(pipfile_lock_path, "r") as f:
+                default = json.load(f).get("default", {})
+        except (OSError, ValueError) as e:
+            print(f"Could not parse {pipfile_lock_path}: {e}")
+            default = {}
+        requirements = []
+        for name, spec in default.items():
+            requirement = name + spec.get("version", "")
+            if spec.get("markers"):
+                requirement += "; " + spec["markers"]
+            requirements.append(requirement)
+        if requirements:
+            return "Pipfile.lock", requirements
+
+    return None, None
+
+def locked_versions(project_path):
+    """
+    Read the pinned package versions from uv.lock or poetry.lock. Returns
+    (lock file name, {normalized name: version}), or (None, {}).
+    """
+    for lock_name in ("uv.lock", "poetry.lock"):
+        lock_path = os.path.join(project_path, lock_name)
+        if not os.path.isfile(lock_path):
+            continue
+        lock = load_toml(lock_path)
+        if not lock:
+            continue
+        versions = {}
+        for package in lock.get("package", []):
+            source = package.get("source", {})
+            # uv.lock lists the project itself as an editable/virtual package
+            if "editable" in source or "virtual" in source or "version" not in package:
+                continue
+            name = normalize_package_name(package["name"])
+            # Several versions of a package (e.g. per platform) cannot be pinned
+            versions[name] = None if name in versions else package["version"]
+        return lock_name, {name: version for name, version in versions.items() if version}
+    return None, {}
+
+def manifest_requirements(project_path, verbose=False):
+    """
+    Build the requirements from the project's manifests instead of crawling
+    imports. Direct dependencies are pinned to the versions in uv.lock or
+    poetry.lock when available. Without declared dependencies, every
+    package of the lock file is used. Returns (list of manifest names,
+    requirements), or (None, None) if the project has no usable manifest.
+    """
+    manifest, requirements = manifest_dependencies(project_path)
+    lock_name, versions = locked_versions(project_path)
+    if requirements is None:
+        if not versions:
+            return None, None
+        return [lock_name], "\n".join(
+            "{}=={}".format(name, version) for name, version in sorted(versions.items())
+        )
+
+    manifests = [manifest]
+    if versions:
+        pinned = []
+        for requirement in requirements:
+            match = re.match(r"\s*([A-Za-z0-9][A-Za-z0-9._-]*)(\[[^\]]*\])?\s*([^;@]*)(.*)", requirement)
+            version = versions.get(normalize_package_name(match.group(1))) if match else None
+            if version is None or match.group(4).lstrip().startswith("@"):
+                pinned.append(requirement)
+                continue
+            pinned.append("{}{}=={}{}".format(match.group(1), match.group(2) or "", version, match.group(4)))
             if verbose:
-                print(f"> {filename}")
-                print(f"> package_list: \n{package_list}")
+                print(f"> {match.group(1)} pinned to {version} by {lock_name}")
+        requirements = pinned
+        manifests.append(lock_name)
+    return manifests, "\n".join(requirements)
 
-            external_imports.append(package_list)
-        #print(f"> external_imports: \n{external_imports}")
+def check_manifest_imports(requirements, import_sources):
+    """
+    Cross-check manifest requirements against the project's imports, using
+    only offline resolution (installed packages and the bundled package
+    map). Returns {module: package} for imports whose package is not
+    declared.
+    """
+    declared = {
+        normalize_package_name(match.group(0))
+        for match in (re.match(r"\s*[A-Za-z0-9][A-Za-z0-9._-]*", line) for line in requirements.splitlines())
+        if match
+    }
+    module_index = load_module_index()
+    missing = {}
+    for module in import_sources:
+        if module in standard_libs:
+            continue
+        package = module_index.get(module) or lookup_package_map(module)
+        if package is not None and normalize_package_name(package) not in declared:
+            missing[module] = package
+    return missing
+
+def extract_requirements_from_code(project_path, ext, generate=True, verbose=False, index=None, ogre_dir=None, jobs=1, import_scanner="ast", use_manifests=True, check_imports=False):
+
+    requirements_emoji()
+
+    manifests = None
+    if generate and use_manifests and ext == ".py":
+        manifests, requirements = manifest_requirements(project_path, verbose)
+    if manifests:
+        print("Using dependencies declared in {}".format(", ".join(manifests)))
+        if check_imports:
+            import_sources = collect_project_imports(
+                project_path, ext, index, ogre_dir, jobs, import_scanner, verbose
+            )
+            first_party = first_party_modules(project_path, index)
+            missing = check_manifest_imports(
+                requirements, {m: f for m, f in import_sources.items() if m not in first_party}
+            )
+            for module, package in sorted(missing.items()):
+                print(f"Warning: {module} is imported in {import_sources[module][0]} but {package} is not declared")
+        if verbose:
+            print(f"> requirements: \n{requirements}")
+    elif generate:
+        import_sources = collect_project_imports(
+            project_path, ext, index, ogre_dir, jobs, import_scanner, verbose
+        )
+        # The project's own modules need no package
+        first_party = first_party_modules(project_path, index)
+        for module in first_party.intersection(import_sources):
+            if verbose:
+                print(f"> {module} -> first-party")
+            del import_sources[module]
+        necessary_packages = resolve_imports(import_sources, verbose)
         # Collapse into a unique list with no duplicates
-        unique_list = list(set(item for sublist in external_imports for item in sublist))
+        unique_list = list(set(necessary_packages.values()))
         requirements = "\n".join(unique_list)
         if verbose:
             print(f"> requirements: \n{requirements}")
@@ -371,35 +1649,246 @@ def extract_requirements_from_code(project_path, ext, generate=True, verbose=Fal
             requirements = f.read()
     return requirements
 
-def lock_requirements(content):
-    output = []  # List to collect each entry's compiled output
+def uv_compile_command(python_version=None, python_platform=None):
+    command = ['uv', 'pip', 'compile', '--no-annotate', '--no-header']
+    index_url = index_url_for_uv()
+    if index_url is not None:
+        command += ['--index-url', index_url]
+    if python_version is not None:
+        command += ['--python-version', python_version]
+    if python_platform is not None:
+        command += ['--python-platform', LOCK_PLATFORMS.get(python_platform, python_platform)]
+    return command
+
+def uv_compile(entries, command=None):
+    """
+    Resolve a list of requirement entries in a single `uv pip compile` run.
+    Returns (success, pinned requirement lines, uv error output).
+    """
+    if command is None:
+        command = uv_compile_command()
+    result = subprocess.run(
+        command + ['-'],
+        input="\n".join(entries),
+        capture_output=True,
+        text=True
+    )
+    lines = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+    return result.returncode == 0, lines, result.stderr
 
-    # Process each line in the provided content
-    for entry in content.strip().splitlines():
-        entry = entry.strip()  # Remove any extra whitespace
-        if entry:  # Ensure the entry is not empty
-            # Run the command and capture the output
-            result = subprocess.run(
-                ['uv', 'pip', 'compile', '--no-annotate', '--no-header', '-'],
-                input=entry,  # Pass entry as a string directly
-                capture_output=True,
-                text=True
-            )
-            elements_list = result.stdout.strip().split('\n')
-            if elements_list != "":
-                output.append(elements_list)  # Append the result to the output list
-
-    # Remove duplicates
-    unique_list = list(set(item for sublist in output for item in sublist))
-    # Remove empty rows
-    unique_list = [item for item in unique_list if item.strip() not in ["", " "]]
+def uv_no_solution(error):
+    """
+    Tell whether a failed uv run means the requirements have no solution
+    (a package missing from the index or conflicting entries), as opposed
+    to a network or index error.
+    """
+    return "No solution found" in error
+
+def find_unresolvable(entries, command=None, failed=False):
+    """
+    Bisect a set of requirement entries that does not resolve to find the
+    entries that cannot be resolved, in O(k log n) uv runs for k bad
+    entries out of n. Pass failed=True if the whole set is known to fail
+    with no solution.
+
+    Returns None if a uv run fails for another reason (e.g. the index is
+    unreachable), since nothing can be concluded about the entries then.
+    """
+    if not failed:
+        success, lines, error = uv_compile(entries, command)
+        if success:
+            return []
+        if not uv_no_solution(error):
+            return None
+    if len(entries) == 1:
+        return list(entries)
+    mid = len(entries) // 2
+    left = find_unresolvable(entries[:mid], command)
+    if left is None:
+        return None
+    right = find_unresolvable(entries[mid:], command)
+    if right is None:
+        return None
+    return left + right
+
+def normalize_requirement(entry):
+    """
+    Normalize a requirement line for comparison: PEP 503 project name and
+    no whitespace, e.g. "Flask_Login >= 0.6" -> "flask-login>=0.6".
+    """
+    match = re.match(r"\s*([A-Za-z0-9][A-Za-z0-9._-]*)(.*)", entry)
+    if not match:
+        return entry.strip()
+    return normalize_package_name(match.group(1)) + re.sub(r"\s+", "", match.group(2))
+
+def lock_cache_key(entries, python_version=None, python_platform=None):
+    """
+    Hash the normalized requirement set together with the target Python
+    version, platform and package index. Without an explicit target, the
+    running interpreter and host platform are used.
+    """
+    if python_platform is not None:
+        python_platform = LOCK_PLATFORMS.get(python_platform, python_platform)
+    key = {
+        "requirements": sorted({normalize_requirement(entry) for entry in entries}),
+        "python": python_version or "{}.{}".format(*sys.version_info[:2]),
+        "platform": python_platform or "{}-{}".format(sys.platform, platform.machine()),
+        "index": index_url_for_uv() or PACKAGE_INDEX_URL,
+    }
+    return content_hash(json.dumps(key, sort_keys=True).encode())
+
+def load_cached_lock(key):
+    """
+    Return the cached lock for a key, or None if it is missing or older
+    than OGRE_LOCK_CACHE_MAX_AGE seconds.
+    """
+    lock_path = os.path.join(config_cache_dir(), LOCK_CACHE_DIR, key + ".json")
+    max_age = float(os.getenv("OGRE_LOCK_CACHE_MAX_AGE", LOCK_CACHE_MAX_AGE))
+    try:
+        if max_age > 0 and time.time() - os.path.getmtime(lock_path) > max_age:
+            return None
+        with open(lock_path, "r") as f:
+            cached = json.load(f)
+        if cached.get("dropped"):
+            # Partial lock written by older versions: resolve it again
+            return None
+        return cached["lock"]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+def store_cached_lock(key, lock):
+    lock_dir = os.path.join(config_cache_dir(), LOCK_CACHE_DIR)
+    lock_path = os.path.join(lock_dir, key + ".json")
+    tmp_path = lock_path + ".tmp"
+    try:
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump({"lock": lock}, f)
+        os.replace(tmp_path, lock_path)
+    except OSError:
+        pass
+
+def lock_requirements(content, batch=True, refresh=False, python_version=None, python_platform=None):
+    """
+    Pin the requirements and their dependencies with uv.
+
+    In batch mode the whole set is resolved in one uv run, which yields a
+    single consistent lock. If uv finds no solution, the entries that
+    cannot be resolved are isolated by bisection and dropped, and the rest
+    is locked together. If the rest still does not resolve (e.g.
+    conflicting entries), if uv fails for another reason (e.g. the index
+    is unreachable), or with batch=False, every entry is resolved on its
+    own and the results are merged. Entries that fail without a uv
+    "no solution" error are kept unpinned rather than dropped.
+
+    Batch locks are cached by requirement set, Python version, platform and
+    index; refresh=True resolves again and replaces the cached lock. Only
+    locks of the full set are cached, so a run that dropped entries is
+    resolved again next time.
+    python_version and python_platform select a target other than the
+    running interpreter.
+    """
+    entries = [entry.strip() for entry in content.strip().splitlines() if entry.strip()]
+    command = uv_compile_command(python_version, python_platform)
+
+    if batch and entries:
+        cache_key = lock_cache_key(entries, python_version, python_platform)
+        if not refresh:
+            lock = load_cached_lock(cache_key)
+            if lock is not None:
+                print("Using cached lock")
+                return lock
+
+        success, lines, error = uv_compile(entries, command)
+        if success:
+            store_cached_lock(cache_key, "\n".join(lines))
+            return "\n".join(lines)
+
+        unresolvable = None
+        if uv_no_solution(error):
+            unresolvable = find_unresolvable(entries, command, failed=True)
+        else:
+            print("uv could not lock the requirements:\n{}".format(error.strip()))
+        if unresolvable:
+            print("Dropping requirements that could not be resolved: {}".format(", ".join(unresolvable)))
+            entries = [entry for entry in entries if entry not in unresolvable]
+            success, lines, error = uv_compile(entries, command)
+            if success:
+                return "\n".join(lines)
+        print("Batch lock failed, resolving requirements one by one")
+
+    output = []  # List to collect each entry's compiled output
+    unpinned = []
+    for entry in entries:
+        success, lines, error = uv_compile([entry], command)
+        if not success and not uv_no_solution(error):
+            # Network or index error: keep the entry rather than drop it
+            lines = [entry]
+            unpinned.append(entry)
+        output.append(lines)
+    if unpinned:
+        print("Keeping requirements that could not be locked unpinned: {}".format(", ".join(unpinned)))
+
+    # Remove duplicates, in a stable order so identical locks hash the same
+    unique_list = sorted(set(item for sublist in output for item in sublist))
     res = "\n".join(unique_list)
     # Join all compiled entries into a single string
     return ''.join(res)
 
-def append_files_with_ext(project_path, ext, limit, output_file):
-    files = list_files(project_path)
-    matching = [f for f in files if os.path.splitext(f)[1] == ext]
+def parse_lock_matrix(lock_matrix):
+    """
+    Parse a comma separated list of PLATFORM:PYTHON_VERSION lock targets,
+    e.g. "linux/amd64:3.11,linux/arm64:3.12", into (platform, version)
+    tuples.
+    """
+    targets = []
+    for target in lock_matrix.split(","):
+        target = target.strip()
+        if not target:
+            continue
+        python_platform, _, python_version = target.rpartition(":")
+        if not python_platform or not python_version:
+            raise ValueError("Invalid lock target: {}. Use PLATFORM:PYTHON_VERSION".format(target))
+        targets.append((python_platform, python_version))
+    return list(dict.fromkeys(targets))
+
+def lock_requirements_matrix(content, targets, batch=True, refresh=False):
+    """
+    Lock the requirements for several (platform, python version) targets at
+    the same time, with at most OGRE_LOCK_WORKERS uv resolvers running.
+    A (None, None) target locks for the host. Returns {target: lock}.
+    """
+    if not targets:
+        return {}
+    workers = int(os.getenv("OGRE_LOCK_WORKERS", LOCK_WORKERS))
+    workers = max(1, min(workers, len(targets)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        locks = pool.map(
+            lambda target: lock_requirements(content, batch, refresh, target[1], target[0]),
+            targets,
+        )
+        return dict(zip(targets, locks))
+
+def save_matrix_requirements(locks, ogre_dir_path):
+    """
+    Write one requirements-<platform>-py<version>.txt file per lock target.
+    Returns the list of written paths.
+    """
+    requirements_paths = []
+    for (python_platform, python_version), requirements in locks.items():
+        slug = re.sub(r"[^A-Za-z0-9_.]+", "-", python_platform).strip("-")
+        requirements_fullpath = os.path.join(
+            ogre_dir_path, "requirements-{}-py{}.txt".format(slug, python_version)
+        )
+        with open(requirements_fullpath, "w") as f:
+            f.write(requirements)
+        requirements_paths.append(requirements_fullpath)
+    return requirements_paths
+
+def append_files_with_ext(project_path, ext, limit, output_file, index=None):
+    if index is None:
+        index = scan_project(project_path)
+    matching = index["by_ext"].get(ext, [])
 
     if limit < len(matching):
         matching = matching[:limit]
@@ -947,22 +2436,209 @@ def remove_first_last_tags(file_path):
 #        f.writelines(cleaned_lines)
 #    print(f"Processed file: {file_path}")
 
+def gitignore_to_dockerignore(lines, base=""):
+    """
+    Translate gitignore-style lines into .dockerignore patterns, which are
+    always matched from the build context root. `base` is the '/'-separated
+    directory of a nested .gitignore. Directory-only patterns (`dir/`) also
+    match files, as .dockerignore cannot express them.
+    """
+    prefix = base + "/" if base else ""
+    patterns = []
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith("\\"):
+            line = line[1:]
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # A slash at the start or in the middle anchors the pattern
+        if "/" in line:
+            pattern = prefix + line.lstrip("/")
+        else:
+            pattern = prefix + "**/" + line
+        patterns.append(("!" if negate else "") + pattern)
+    return patterns
+
+def _dockerignore_escape(path):
+    return re.sub(r"([*?\[\]\\])", r"\\\1", path.replace(os.sep, "/"))
+
+def build_context_files(index, ogre_dir, ogre_dir_only=False):
+    """
+    List the files sent to a Docker build by the rules of
+    generate_dockerignore. Returns (context files as (path, size,
+    mtime_ns) tuples, project files left out for their size).
+    """
+    files = []
+    large_files = []
+    if not ogre_dir_only:
+        max_size = int(os.getenv("OGRE_CONTEXT_MAX_FILE_SIZE", CONTEXT_MAX_FILE_SIZE))
+        for path, (size, mtime) in index["stats"].items():
+            if size > max_size:
+                large_files.append(path)
+            else:
+                files.append((path, size, mtime))
+    for name in DOCKER_CONTEXT_OGRE_FILES:
+        for path in sorted(glob.glob(os.path.join(ogre_dir, name))):
+            st = os.stat(path)
+            files.append((path, st.st_size, st.st_mtime_ns))
+    return files, large_files
+
+def generate_dockerignore(project_path, ogre_dir, index=None, ogre_dir_only=False):
+    """
+    Write <ogre_dir>/Dockerfile.dockerignore, the ignore file BuildKit uses
+    for ogre_dir/Dockerfile, to keep the build context small. It combines
+    the scan's skip and ignore rules (.gitignore files, .dockerignore,
+    .miniogreignore), files larger than OGRE_CONTEXT_MAX_FILE_SIZE (the
+    project is mounted into the container at runtime) and the ogre_dir
+    artifacts, except the files the Dockerfiles copy. With ogre_dir_only,
+    nothing outside ogre_dir is sent (base image builds).
+
+    Returns the estimated context size in bytes.
+    """
+    ogre_rel = _relpath(os.path.abspath(ogre_dir), os.path.abspath(project_path)).replace(os.sep, "/")
+    ogre_files = ["!{}/{}".format(ogre_rel, name) for name in DOCKER_CONTEXT_OGRE_FILES]
+    lines = ["# Generated by miniogre, do not edit"]
+    if index is None and not ogre_dir_only:
+        index = scan_project(project_path, ogre_dir)
+    context_files, large_files = build_context_files(index, ogre_dir, ogre_dir_only)
+
+    if ogre_dir_only:
+        lines += ["*"] + ogre_files
+    else:
+        lines += ["**/" + name for name in SCAN_SKIP_DIRS]
+        lines += gitignore_to_dockerignore(DEFAULT_IGNORE_PATTERNS)
+        for ignore_file in IGNORE_FILES:
+            ignore_path = os.path.join(project_path, ignore_file)
+            if not os.path.isfile(ignore_path):
+                continue
+            ignore_lines = read_file_contents(ignore_path).splitlines()
+            if ignore_file == ".dockerignore":
+                lines += [line.strip() for line in ignore_lines if line.strip() and not line.startswith("#")]
+            else:
+                lines += gitignore_to_dockerignore(ignore_lines)
+        for root, filenames in index["dirs"].items():
+            if root != index["root"] and ".gitignore" in filenames:
+                base = _relpath(root, index["root"]).replace(os.sep, "/")
+                lines += gitignore_to_dockerignore(
+                    read_file_contents(os.path.join(root, ".gitignore")).splitlines(), base
+                )
+
+        for path in large_files:
+            lines.append(_dockerignore_escape(_relpath(path, index["root"])))
+        lines += [ogre_rel] + ogre_files
+
+    with open(os.path.join(ogre_dir, "Dockerfile.dockerignore"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    for path in large_files:
+        print("   excluded from build context: {} ({})".format(
+            _relpath(path, index["root"]), format_size(index["stats"][path][0])
+        ))
+    # Estimate what is left: the scanned files plus the ogre_dir files
+    context_size = sum(size for path, size, mtime in context_files)
+    print("   estimated build context = {} ({} files)".format(format_size(context_size), len(context_files)))
+    return context_size
+
+def image_content_tag(project_path, ogre_dir, index, host_platform="auto"):
+    """
+    Derive an image tag from the build inputs: the contents of the
+    Dockerfile, its ignore file, the locked requirements and the other
+    ogre_dir files in the context, the (path, size, mtime) manifest of the
+    project files in the context, and the target platform.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(host_platform.encode())
+    ogre_dir = os.path.abspath(ogre_dir)
+    context_files, large_files = build_context_files(index, ogre_dir)
+    dockerignore_path = os.path.join(ogre_dir, "Dockerfile.dockerignore")
+    if os.path.isfile(dockerignore_path):
+        context_files.append((dockerignore_path, None, None))
+    for path, size, mtime in context_files:
+        if os.path.dirname(path) == ogre_dir:
+            with open(path, "rb") as f:
+                h.update("{}\0{}\n".format(os.path.basename(path), content_hash(f.read())).encode())
+        else:
+            h.update("{}\0{}\0{}\n".format(_relpath(path, index["root"]), size, mtime).encode())
+    return h.hexdigest()[:IMAGE_TAG_LENGTH]
+
+def tag_docker_image(image_name, target_name):
+    subprocess.run(["docker", "tag", image_name, target_name], capture_output=True)
+
+def docker_image_size(image_name):
+    """
+    Return the size in bytes of a local Docker image, or None if the image
+    does not exist.
+    """
+    try:
+        result = subprocess.run(
+            ["docker", "image", "inspect", "--format", "{{.Size}}", image_name],
+            capture_output=True,
+            text=True
+        )
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    return int(result.stdout.strip())
+
+def format_size(num_bytes):
+    for unit in ["B", "KB", "MB"]:
+        if abs(num_bytes) < 1000:
+            return "{:.1f} {}".format(num_bytes, unit)
+        num_bytes /= 1000
+    return "{:.1f} GB".format(num_bytes)
+
+def report_image_size(image_name, previous_size=None, reference_image=None):
+    """
+    Print the size of a built image, compared with the previous build of the
+    same tag and, optionally, with a reference image.
+    """
+    size = docker_image_size(image_name)
+    if size is None:
+        return None
+    print("   image size = {}".format(format_size(size)))
+    if previous_size is not None:
+        print("   previous build = {} ({:+.1f}%)".format(
+            format_size(previous_size), 100 * (size - previous_size) / previous_size
+        ))
+    reference_size = docker_image_size(reference_image) if reference_image else None
+    if reference_size is not None:
+        print("   {} = {} ({:+.1f}%)".format(
+            reference_image, format_size(reference_size), 100 * (size - reference_size) / reference_size
+        ))
+    return size
+
 def build_docker_image(
-    dockerfile, image_name, host_platform="auto", verbose=False, cache=False
+    dockerfile, image_name, host_platform="auto", verbose=False, cache=False, reference_image=None,
+    tag=None, skip_existing=False
 ):
-    # TODO: Generate unique tag to avoid name clashing among different users
-    # tag = uuid.uuid4().hex
+    """
+    Build the image as miniogre/<image_name>:<tag> and point :latest at it.
+    With skip_existing, an image that already has the (content-derived)
+    tag is reused without building.
+    """
 
     if host_platform == "auto":
         platform_name = "linux/{}".format(platform.machine())
     else:
         platform_name = "linux/{}".format(host_platform)
-    image_name = "miniogre/{}:latest".format(image_name.lower())
+    latest_name = "miniogre/{}:latest".format(image_name.lower())
+    image_name = "miniogre/{}:{}".format(image_name.lower(), tag or "latest")
 
     build_emoji()
     print("   platform = {}".format(platform_name))
     print("   image name = {}".format(image_name))
 
+    if tag and skip_existing and docker_image_size(image_name) is not None:
+        print("   image is up to date, skipping build")
+        tag_docker_image(image_name, latest_name)
+        return b""
+
     if verbose:
         stderr = None
         progress = "plain"
@@ -979,6 +2655,7 @@ def build_docker_image(
         cache_option, progress, platform_name, image_name, dockerfile
     )
     print("   build command = {}".format(build_cmd))
+    previous_size = docker_image_size(latest_name)
 
     if verbose:
         p = subprocess.Popen(
@@ -994,6 +2671,10 @@ def build_docker_image(
             )
             (out, err) = p.communicate()
             p_status = p.wait()
+    if p_status == 0:
+        if image_name != latest_name:
+            tag_docker_image(image_name, latest_name)
+        report_image_size(image_name, previous_size, reference_image)
     return out
 
 
@@ -1108,6 +2789,35 @@ def run_gptify(repo_path):
         return f.read()
 
 
+def clear_cache(target="all"):
+    """
+    Delete cached data from the miniogre cache dir. `target` is one of the
+    CACHE_FILES keys, or "all". Returns the list of removed paths.
+    """
+    if target == "all":
+        filenames = [f for files in CACHE_FILES.values() for f in files]
+    elif target in CACHE_FILES:
+        filenames = CACHE_FILES[target]
+    else:
+        raise ValueError(
+            "Invalid cache: {}. Choose from: all, {}".format(target, ", ".join(CACHE_FILES))
+        )
+
+    removed = []
+    cache_dir = config_cache_dir()
+    for filename in filenames:
+        file_path = os.path.join(cache_dir, filename)
+        if os.path.isdir(file_path):
+            shutil.rmtree(file_path)
+            removed.append(file_path)
+        elif os.path.exists(file_path):
+            os.remove(file_path)
+            removed.append(file_path)
+    if "modules" in (target, "all"):
+        load_module_index.cache_clear()
+    return removed
+
+
 def cleanup():
     """
     Delete unnecessary files
@@ -1329,7 +3039,7 @@ def delete_tarfile(file_path):
     except Exception as e:
         print(f"An error occurred while trying to delete the file: {e}")
 
-def detect_language_and_framework(project_path: str):
+def detect_language_and_framework(project_path: str, index=None):
     """
     Detect programming language(s) and framework of a source code.
 
@@ -1345,35 +3055,40 @@ def detect_language_and_framework(project_path: str):
     detected_language = set()
     detected_framework = None
 
-    # Walk through the project directory and examine the files
-    for root, dirs, files in os.walk(project_path):
-        for file in files:
-            # Check language based on file extension
-            for language, extensions in languages.items():
-                if any(file.endswith(ext) for ext in extensions):
-                    detected_language.add(language)
-
-        # Check for JavaScript/TypeScript frameworks
-        if "package.json" in files:
-            package_json_path = os.path.join(root, "package.json")
-            with open(package_json_path, 'r', encoding='utf-8') as f:
-                package_content = f.read()
-
-            # Check for framework-specific dependencies
-            # Special case for Angular
-            if "angular.json" in files:
-                detected_framework = "Angular"
-            else:
-                for framework, (config_file, keywords) in js_ts_frameworks.items():
-                    if config_file in files:
-                        for keyword in keywords:
-                            if keyword in package_content:
-                                detected_framework = framework
+    if index is None:
+        index = scan_project(project_path)
+    elif index.get("lang_frame") is not None:
+        # Nothing changed since the persisted scan: reuse its result
+        print(index["lang_frame"])
+        return index["lang_frame"]
+
+    # Check language based on the extensions present in the project
+    for language, extensions in languages.items():
+        if any(ext in index["by_ext"] for ext in extensions):
+            detected_language.add(language)
+
+    # Check for JavaScript/TypeScript frameworks
+    for package_json_path in index["package_json"]:
+        files = index["dirs"][os.path.dirname(package_json_path)]
+        with open(package_json_path, 'r', encoding='utf-8') as f:
+            package_content = f.read()
+
+        # Check for framework-specific dependencies
+        # Special case for Angular
+        if "angular.json" in files:
+            detected_framework = "Angular"
+        else:
+            for framework, (config_file, keywords) in js_ts_frameworks.items():
+                if config_file in files:
+                    for keyword in keywords:
+                        if keyword in package_content:
+                            detected_framework = framework
 
     res = {
         "languages": list(detected_language),
         "framework": detected_framework if detected_framework else None
     }
+    index["lang_frame"] = res
     print(res)
 
     return res
@@ -1,6 +1,7 @@
 import os
 import platform
 import random
+import sys
 import requests
 
 from dotenv import load_dotenv
@@ -62,6 +63,21 @@ def config_ogre_dir(ogre_dir):
     return ogre_dir
 
 
+def config_cache_dir():
+    """
+    Return the miniogre cache directory shared by all projects, creating it
+    if it doesn't exist. If it can't be created, the path is still returned
+    and callers run without the cache.
+    """
+    cache_dir = os.path.expanduser(os.getenv("OGRE_CACHE_DIR", OGRE_CACHE_DIR))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        pass
+
+    return cache_dir
+
+
 def _run_welcome(project_path, product, version, ogre_dir, date):
 
     original_pwd = os.getcwd()
@@ -140,19 +156,20 @@ def config_dockerfile(
     ogre_dir, 
     baseimage, 
     dry=False, 
-    base=False
+    base=False,
+    slim=False
 ):
     """
     Check for existence of Dockerfile. If it exists, nothing is done. If it
     doesn't, a new Dockerfile is generate following the parameters in the
-    config file.
+    config file. With slim=True, Python projects get a multi-stage
+    Dockerfile with a slim runtime image instead of `baseimage`.
     """
 
-    REQUIREMENTS_LINE = "RUN cat ./{}/requirements.txt | xargs -L 1 uv pip install --system; exit 0".format(
-        os.path.basename(ogre_dir)
-    )
     if dry:
         print("Dry build -- no requirements will be installed {}".format(baseimage))
+        if slim:
+            print("   --slim has no effect on dry builds")
 
         dockerfile_string = DOCKERFILE_DRY
 
@@ -191,26 +208,39 @@ def config_dockerfile(
 
         if os.path.isfile("{}/Dockerfile".format(project_dir)):
             print("   Dockerfile exists in {}".format(project_dir))
+            if slim:
+                print("   --slim has no effect on an existing Dockerfile")
             os.popen("cp {}/Dockerfile {}/Dockerfile".format(project_dir, ogre_dir))
+        elif framework == None and slim:
+            python_version = "{}.{}".format(*sys.version_info[:2])
+            builder_image = os.getenv("OGRE_SLIM_BUILDER_IMAGE", OGRE_SLIM_BUILDER_IMAGE).format(python_version)
+            runtime_image = os.getenv("OGRE_SLIM_RUNTIME_IMAGE", OGRE_SLIM_RUNTIME_IMAGE).format(python_version)
+            print(
+                "   Dockerfile doesn't exist. Making a slim one for you: {} -> {}".format(
+                    builder_image, runtime_image
+                )
+            )
+            with open("{}/Dockerfile".format(ogre_dir), "w") as f:
+                f.write(DOCKERFILE_SLIM.format(
+                    project_name, os.path.basename(ogre_dir), builder_image, runtime_image, TIMEZONE
+                ))
         else:
             print(
                 "   Dockerfile doesn't exist. Making a new one for you using {}".format(
                     baseimage
                 )
             )
-            if framework == None: 
+            if slim:
+                print("   --slim only applies to Python projects, using {}".format(baseimage))
+            if framework == None:
                 dockerfile_string = DOCKERFILE
-                print
                 with open("{}/Dockerfile".format(ogre_dir), "w") as f:
-                    f.write(dockerfile_string.format(project_name))
+                    f.write(dockerfile_string.format(project_name, os.path.basename(ogre_dir)))
                 f.close()
                 with open("{}/Dockerfile".format(ogre_dir), "r+") as f:
                     content = f.read()
                     f.seek(0, 0)
                     f.write("FROM {}\nENV TZ={}".format(baseimage, TIMEZONE) + content)
-                    # Find last line
-                    f.seek(0, 2)
-                    f.write("{}".format(REQUIREMENTS_LINE))
                 f.close()
             elif framework in FRAMEWORKS_LIST:
                 dockerfile_string = DOCKERFILE_NODE
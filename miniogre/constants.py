@@ -3,7 +3,7 @@ TIMEOUT_API_REQUEST = 240
 DOCKERFILE_NODE = """
 WORKDIR /opt/{}
 COPY package*.json ./
-RUN npm install || true
+RUN --mount=type=cache,target=/root/.npm npm install || true
 COPY . .
 RUN cp ./ogre_dir/bashrc /etc/bash.bashrc
 RUN chmod a+rwx /etc/bash.bashrc
@@ -11,13 +11,46 @@ RUN npm run build || true
 CMD npm start || true
 """
 
+# Requirements are installed before the source is copied, so code-only
+# changes reuse the dependency layers. If the locked set fails to install in
+# one go, packages are installed one by one and failures are ignored.
+# The pip/uv caches are BuildKit cache mounts, so downloaded wheels survive
+# rebuilds; uv copies from its cache because the mount is another filesystem.
 DOCKERFILE = """
 RUN ln -snf /usr/share/zoneinfo/$TZ /etc/localtime && echo $TZ > /etc/timezone
-WORKDIR /opt/{}
+ENV UV_LINK_MODE=copy
+WORKDIR /opt/{0}
+RUN --mount=type=cache,target=/root/.cache/pip \\
+    pip install uv pip-licenses cyclonedx-bom
+COPY ./{1}/requirements.txt ./{1}/requirements.txt
+RUN --mount=type=cache,target=/root/.cache/uv \\
+    uv pip install --system -r ./{1}/requirements.txt || \\
+    (xargs -L 1 uv pip install --system < ./{1}/requirements.txt; exit 0)
 COPY . .
 RUN cp ./ogre_dir/bashrc /etc/bash.bashrc
 RUN chmod a+rwx /etc/bash.bashrc
-RUN pip install uv pip-licenses cyclonedx-bom
+"""
+
+# `--slim`: requirements are installed into a venv in a full builder image
+# (compilers available for sdists) and only the venv and the source are
+# copied into a slim runtime image with the same Python. Formatted with the
+# project name, the ogre_dir name, the builder and runtime images and TZ.
+DOCKERFILE_SLIM = """FROM {2} AS builder
+ENV UV_LINK_MODE=copy VIRTUAL_ENV=/opt/venv
+RUN --mount=type=cache,target=/root/.cache/pip \\
+    pip install uv && uv venv --python /usr/local/bin/python $VIRTUAL_ENV
+COPY ./{1}/requirements.txt /tmp/requirements.txt
+RUN --mount=type=cache,target=/root/.cache/uv \\
+    uv pip install -r /tmp/requirements.txt || \\
+    (xargs -L 1 uv pip install < /tmp/requirements.txt; exit 0)
+
+FROM {3}
+ENV TZ={4} VIRTUAL_ENV=/opt/venv PATH="/opt/venv/bin:$PATH"
+RUN ln -snf /usr/share/zoneinfo/$TZ /etc/localtime && echo $TZ > /etc/timezone
+COPY --from=builder /opt/venv /opt/venv
+WORKDIR /opt/{0}
+COPY . .
+RUN cp ./{1}/bashrc /etc/bash.bashrc && chmod a+rwx /etc/bash.bashrc
 """
 
 DOCKERFILE_DRY = """
@@ -30,8 +63,13 @@ RUN chmod a+rwx /etc/bash.bashrc
 
 DOCKERFILE_BASEIMAGE = """
 RUN ln -snf /usr/share/zoneinfo/$TZ /etc/localtime && echo $TZ > /etc/timezone
-RUN apt-get update && apt-get install -y ttyd sudo build-essential cmake wget htop python3-dev python3-pip
-RUN pip install miniogre
+# Keep downloaded packages in the apt cache mounts instead of deleting them
+RUN rm -f /etc/apt/apt.conf.d/docker-clean && \\
+    echo 'Binary::apt::APT::Keep-Downloaded-Packages "true";' > /etc/apt/apt.conf.d/keep-cache
+RUN --mount=type=cache,target=/var/cache/apt,sharing=locked \\
+    --mount=type=cache,target=/var/lib/apt,sharing=locked \\
+    apt-get update && apt-get install -y ttyd sudo build-essential cmake wget htop python3-dev python3-pip
+RUN --mount=type=cache,target=/root/.cache/pip pip install miniogre
 # Create a custom user with UID 1234 and GID 1234. Password is set during build time.
 RUN groupadd -g 1234 ogre && \
     useradd -m -u 1234 -g ogre user && echo "user:{}" | chpasswd && \
@@ -301,10 +339,105 @@ FRAMEWORK_DOCKERFILE = {
         None: "DOCKERFILE",
 }
 
+# Directories that are never descended into when scanning a project
+SCAN_SKIP_DIRS = [".git", "__pycache__"]
+
+# Ignore files honoured when scanning a project, in order of precedence
+IGNORE_FILES = [".gitignore", ".dockerignore", ".miniogreignore"]
+
+# Patterns ignored even if the project has no ignore files
+DEFAULT_IGNORE_PATTERNS = [
+    "node_modules/",
+    ".venv/",
+    "venv/",
+    ".tox/",
+    ".nox/",
+    ".mypy_cache/",
+    ".pytest_cache/",
+    ".ruff_cache/",
+    ".ipynb_checkpoints/",
+]
+
+# Number of threads used to scan the project (1 = single-threaded walk)
+SCAN_WORKERS = 1
+
+# Persistent project scan index (stored in ogre_dir)
+SCAN_INDEX_FILE = "scan_index.json"
+SCAN_INDEX_VERSION = 1
+# Entries modified less than this many nanoseconds before a scan are
+# re-checked on the next one (filesystem timestamp granularity)
+SCAN_INDEX_RACY_NS = 2_000_000_000
+
+# Cache of imports found in each file, keyed by content hash (in ogre_dir)
+IMPORT_CACHE_FILE = "import_cache.sqlite"
+IMPORT_CACHE_VERSION = 3
+# Largest number of files sent to a worker process at once (--jobs)
+IMPORT_PARSE_MAX_BATCH = 256
+
+# Installed module -> distribution index (stored in OGRE_CACHE_DIR)
+MODULE_INDEX_FILE = "module_index.json"
+
+# Files that make a module importable from the project itself
+FIRST_PARTY_EXTENSIONS = ["py", "pyi", "so", "pyd"]
+
+# Bundled import name -> PyPI package table (sorted "import\tpackage" lines)
+PACKAGE_MAP_DIR = "mappings"
+PACKAGE_MAP_FILE = "package_map.tsv"
+PACKAGE_MAP_VERSION = 1
+
+# Package index used to check imports that are not installed locally and to
+# lock requirements: "simple" (PEP 691 JSON API at PACKAGE_INDEX_URL), "local"
+# (directory mirror, picked when OGRE_INDEX_URL is a path) or "json" (legacy
+# PyPI JSON API at PYPI_URL)
+PACKAGE_INDEX_BACKEND = "simple"
+PACKAGE_INDEX_BACKENDS = ["simple", "local", "json"]
+PACKAGE_INDEX_URL = "https://pypi.org/simple"
+SIMPLE_API_ACCEPT = "application/vnd.pypi.simple.v1+json, text/html;q=0.1"
+
+# PyPI lookups for imports that are not installed locally
+PYPI_URL = "https://pypi.org"
+PYPI_TIMEOUT = 10  # seconds, per request
+PYPI_CONCURRENCY = 16
+PYPI_CACHE_FILE = "pypi_cache.json"  # in OGRE_CACHE_DIR
+PYPI_CACHE_TTL = 7 * 24 * 3600  # seconds, for names found on PyPI
+PYPI_CACHE_NEGATIVE_TTL = 24 * 3600  # seconds, for names not found
+
+# Locked requirements, one file per requirement set/target in OGRE_CACHE_DIR
+LOCK_CACHE_DIR = "locks"
+LOCK_CACHE_MAX_AGE = 7 * 24 * 3600  # seconds, 0 to never expire
+
+# Parallel uv resolvers for `--lock-matrix`, and docker/machine names of lock
+# platforms mapped to uv's --python-platform targets
+LOCK_WORKERS = 4
+LOCK_PLATFORMS = {
+    "linux/amd64": "x86_64-unknown-linux-gnu",
+    "linux/arm64": "aarch64-unknown-linux-gnu",
+    "x86_64": "x86_64-unknown-linux-gnu",
+    "amd64": "x86_64-unknown-linux-gnu",
+    "arm64": "aarch64-unknown-linux-gnu",
+    "aarch64": "aarch64-unknown-linux-gnu",
+}
+
+# Files and dirs in OGRE_CACHE_DIR removed by `miniogre cache clear <name>`
+CACHE_FILES = {
+    "pypi": [PYPI_CACHE_FILE],
+    "modules": [MODULE_INDEX_FILE],
+    "lock": [LOCK_CACHE_DIR],
+}
+
 WORDLIST_URL = "https://www.eff.org/files/2016/07/18/eff_large_wordlist.txt"
 
 OGRE_DIR = "ogre_dir"
+OGRE_CACHE_DIR = "~/.cache/miniogre"
 OGRE_BASEIMAGE = "ogrerun/base:ubuntu22.04-{}"
+# Build context: larger files are left out (the project is mounted into the
+# container at runtime), and the ogre_dir files the Dockerfiles copy are kept
+CONTEXT_MAX_FILE_SIZE = 50_000_000  # bytes
+DOCKER_CONTEXT_OGRE_FILES = ["bashrc", "requirements*.txt", "Dockerfile", "ttyd_entrypoint.sh"]
+IMAGE_TAG_LENGTH = 16  # hex characters of the build inputs hash
+# `--slim` images, formatted with the Python version of the requirements lock
+OGRE_SLIM_BUILDER_IMAGE = "python:{}"
+OGRE_SLIM_RUNTIME_IMAGE = "python:{}-slim"
 OPENAI_MODEL = "gpt-4o"
 OPENAI_SECRET_PROMPT = """You are a Python requirements generator.
 You should generate the contents of a Python requirements file (raw text only) taking into account the text sent by the user.
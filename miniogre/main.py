@@ -10,6 +10,8 @@ from .actions import *
 from .config import *
 
 app = typer.Typer()
+cache_app = typer.Typer(help="Manage miniogre caches")
+app.add_typer(cache_app, name="cache")
 load_dotenv()
 
 project_path = os.getcwd()
@@ -156,28 +158,47 @@ def run(
     sbom_format: str = "pip-licenses",
     no_container: bool = False,
     verbose: bool = False,
-    cache: bool = False,
+    no_cache: bool = False,
     host_platform: str = "auto",
     with_readme: bool = False,
-    device: str = "cpu"):
+    device: str = "cpu",
+    jobs: int = 1,
+    import_scanner: str = "ast",
+    batch_lock: bool = True,
+    refresh_lock: bool = False,
+    lock_matrix: str = "",
+    use_manifests: bool = True,
+    check_manifest_imports: bool = False,
+    slim: bool = False):
     """
     Run full miniogre pipeline
     """
 
+    try:
+        lock_targets = [(None, None)] + parse_lock_matrix(lock_matrix)
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--lock-matrix")
+    if import_scanner not in IMPORT_SCANNERS:
+        raise typer.BadParameter(
+            "Invalid import scanner: {}. Choose from: {}".format(import_scanner, ", ".join(IMPORT_SCANNERS)),
+            param_hint="--import-scanner",
+        )
+
     display_figlet()
     starting_emoji()
 
     project_name = os.path.basename(project_path)
 
-    files = list_files(project_path)
-    ipynb_to_py_list = ipynb_to_py(project_path, verbose)
-    lang_frame = detect_language_and_framework(project_path)
-    extensions = get_extensions(files)
-    counts = count_extensions(extensions)
-    most_ext = determine_most_ext(counts)
     ogre_dir_path = config_ogre_dir(
         os.path.join(project_path, os.getenv("OGRE_DIR", OGRE_DIR))
     )
+    # Walk the project once; every stage below queries this index
+    index = scan_project(project_path, ogre_dir_path)
+    files = list_files(project_path, index)
+    lang_frame = detect_language_and_framework(project_path, index)
+    extensions = get_extensions(files)
+    counts = count_extensions(extensions)
+    most_ext = determine_most_ext(counts)
     if with_readme:
         context_contents = run_gptify(os.getcwd())
         num_tokens = count_tokens(context_contents)
@@ -189,14 +210,21 @@ def run(
             project_path, ogre_dir_path, force_requirements_generation
         )
         local_requirements = extract_requirements_from_code(
-            project_path, most_ext, generate_requirements, verbose
+            project_path, most_ext, generate_requirements, verbose, index, ogre_dir_path,
+            jobs, import_scanner, use_manifests, check_manifest_imports
         )
         
-        # Remove cleaning with LLM and lock requirements
-        final_requirements = lock_requirements(local_requirements)
+        # Remove cleaning with LLM and lock requirements. The host lock and
+        # any --lock-matrix targets (PLATFORM:PYTHON_VERSION,...) resolve
+        # concurrently
+        locks = lock_requirements_matrix(local_requirements, lock_targets, batch_lock, refresh_lock)
+        final_requirements = locks.pop((None, None))
+        for matrix_path in save_matrix_requirements(locks, ogre_dir_path):
+            print("Saved {}".format(matrix_path))
 
         # final_requirements = clean_requirements(provider, local_requirements)
         requirements_fullpath = save_requirements(final_requirements, ogre_dir_path)
+    save_scan_index(index, ogre_dir_path)
     config_bashrc(project_path, ogre_dir_path, None, None, None)
 
     if host_platform == 'auto':
@@ -209,16 +237,33 @@ def run(
     else:
         baseimage_name = baseimage
     config_dockerfile(project_path, project_name, lang_frame['framework'],
-                      ogre_dir_path, baseimage_name, dry)
+                      ogre_dir_path, baseimage_name, dry, slim=slim)
+    # --slim only changes generated Dockerfiles of Python projects
+    slim_build = (slim and not dry and lang_frame['framework'] == None
+                  and not os.path.isfile(os.path.join(project_path, "Dockerfile")))
+    dockerignore_path = os.path.join(ogre_dir_path, "Dockerfile.dockerignore")
+    if not os.path.isfile(os.path.join(project_path, "Dockerfile")):
+        generate_dockerignore(project_path, ogre_dir_path, index)
+    elif os.path.isfile(dockerignore_path):
+        # The project's own Dockerfile uses the project's .dockerignore
+        os.remove(dockerignore_path)
     create_sbom(project_name, project_path, sbom_format, verbose)
-    cleanup_converted_py(ipynb_to_py_list)
     if no_container == False:
+        # Identical inputs give the same tag, so an unchanged project skips
+        # the build. The context of a project's own Dockerfile is unknown,
+        # so it is always built
+        image_tag = image_content_tag(project_path, ogre_dir_path, index, platform_machine)
         build_docker_image(
             os.path.join(ogre_dir_path, "Dockerfile"),
             project_name,
             platform_machine,
             verbose,
-            cache,
+            # Reuse the Docker layer cache unless --no-cache is given
+            not no_cache,
+            # compare a slim image with the default base image
+            baseimage_name if slim_build else None,
+            image_tag,
+            skip_existing=not os.path.isfile(os.path.join(project_path, "Dockerfile")),
         )
         spin_up_container(project_name, 
                           project_path, 
@@ -239,7 +284,12 @@ def spinup(port_map: str = "8001:8001",
     starting_emoji()
 
     project_name = os.path.basename(project_path)
-    lang_frame = detect_language_and_framework(project_path)
+    ogre_dir_path = config_ogre_dir(
+        os.path.join(project_path, os.getenv("OGRE_DIR", OGRE_DIR))
+    )
+    index = scan_project(project_path, ogre_dir_path)
+    lang_frame = detect_language_and_framework(project_path, index)
+    save_scan_index(index, ogre_dir_path)
     spin_up_container(project_name, 
                       project_path, 
                       port_map, 
@@ -282,6 +332,7 @@ def build_ogre_image(
     secure_passphrase = config_dockerfile(
         project_path, "ogre", None, ogre_dir_path, baseimage_name, dry=False, base=True
     )
+    generate_dockerignore(project_path, ogre_dir_path, ogre_dir_only=True)
     build_docker_image(
         os.path.join(ogre_dir_path, "Dockerfile"),
         image_name,
@@ -295,6 +346,23 @@ def build_ogre_image(
     end_emoji()
 
 
+@cache_app.command("clear")
+def cache_clear(target: str = typer.Argument("all")):
+    """
+    Clear a miniogre cache (pypi, modules, lock or all)
+    """
+
+    try:
+        removed = clear_cache(target)
+    except ValueError as e:
+        print(e)
+        raise typer.Exit(1)
+    for file_path in removed:
+        print("Removed {}".format(file_path))
+    if not removed:
+        print("Nothing to clear.")
+
+
 @app.command()
 def cloud(
     proxy: str = "https://fileserver.ogrerun.xyz",
@@ -0,0 +1,168 @@
+"""
+Build the bundled import name -> PyPI package table used for offline
+requirement resolution (miniogre/mappings/package_map.tsv).
+
+Usage: python scripts/build_package_map.py [--installed] [--wheels DIR] [--check-index] [--replace] [SOURCE ...]
+
+Each SOURCE is either a TSV file with "import<TAB>package" lines or a JSON
+file with an {"import": "package"} object, e.g. exported from the top-level
+module metadata of the most downloaded PyPI packages. Entries are merged
+into the existing table; later sources win. With --installed, the
+top-level modules of the distributions installed in the current
+environment are added as well. With --wheels, the top-level modules of
+every wheel under DIR (e.g. a local mirror) are added. With --check-index,
+entries from --installed and --wheels that map a module to a package of
+another name are dropped when the package index (OGRE_INDEX_URL) has a
+project named like the module: a wheel subset can't tell which of the two
+an import means (e.g. retry and its fork retry2), and without the entry
+the index lookup finds the project named like the module, as it would
+without the table.
+
+The shipped table is built with:
+
+    python scripts/build_package_map.py --replace --wheels <mirror> --check-index scripts/package_map_seed.tsv
+
+where package_map_seed.tsv holds hand-checked entries, mostly import names
+that differ from the package name.
+"""
+import argparse
+import importlib.metadata
+import json
+import os
+import re
+import zipfile
+
+from miniogre.actions import normalize_package_name, query_pypi_many, write_package_map
+from miniogre.constants import PACKAGE_MAP_DIR, PACKAGE_MAP_FILE
+
+MAP_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "miniogre", PACKAGE_MAP_DIR, PACKAGE_MAP_FILE,
+)
+
+
+def read_source(path):
+    if path.endswith(".json"):
+        with open(path) as f:
+            return json.load(f)
+    mapping = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            module, _, package = line.rstrip("\n").partition("\t")
+            mapping[module.strip()] = package.strip()
+    return mapping
+
+
+def installed_mapping():
+    mapping = {}
+    for module, dists in importlib.metadata.packages_distributions().items():
+        # Skip private and namespace modules shared by several distributions
+        if module.startswith("_") or not module.isidentifier() or len(set(dists)) != 1:
+            continue
+        mapping[module] = dists[0]
+    return mapping
+
+
+# Top-level names that some wheels ship but that do not identify the
+# package: test and doc trees, stubs, fixtures and shared namespaces
+SKIP_MODULES = {
+    "test", "tests", "testing", "docs", "doc", "examples", "example", "benchmarks", "scripts",
+    "dummy", "images", "newsfragments", "typings", "sphinxcontrib",
+}
+
+
+def wheel_modules(wheel_path):
+    """
+    Return (project name, top-level modules) of a wheel, from top_level.txt
+    or, without it, from the files it installs.
+    """
+    project = re.sub(r"[-_.]+", "-", os.path.basename(wheel_path).split("-")[0]).lower()
+    with zipfile.ZipFile(wheel_path) as wheel:
+        names = wheel.namelist()
+        top_level = [name for name in names if name.endswith(".dist-info/top_level.txt")]
+        if top_level:
+            modules = wheel.read(top_level[0]).decode("utf-8", "replace").split()
+        else:
+            # Top-level modules and directories holding Python files;
+            # other directories (e.g. lib64/) are not importable
+            modules = []
+            for name in names:
+                parts = name.split("/")
+                if parts[0].endswith((".dist-info", ".data")):
+                    continue
+                if len(parts) == 1 and name.endswith((".py", ".so", ".pyd")):
+                    modules.append(name.split(".")[0])
+                elif len(parts) == 2 and name.endswith(".py"):
+                    modules.append(parts[0])
+    modules = {module.split("/")[0] for module in modules}
+    # Skip private modules and generated names such as <hash>__mypyc
+    return project, {
+        m for m in modules
+        if m.isidentifier() and not m.startswith("_") and "__" not in m
+        and m not in SKIP_MODULES and not m.endswith("tests")
+    }
+
+
+def wheels_mapping(wheels_dir):
+    owners = {}
+    for root, dirs, files in os.walk(wheels_dir):
+        for filename in files:
+            if not filename.endswith(".whl"):
+                continue
+            try:
+                project, modules = wheel_modules(os.path.join(root, filename))
+            except (zipfile.BadZipFile, OSError):
+                continue
+            for module in modules:
+                owners.setdefault(module, set()).add(project)
+    # Skip namespace modules shared by several projects (e.g. google)
+    return {module: projects.pop() for module, projects in owners.items() if len(projects) == 1}
+
+
+def drop_shadowed(mapping):
+    """
+    Drop entries mapping a module to a differently named package when the
+    index has a project named like the module.
+    """
+    renamed = [m for m, p in mapping.items() if normalize_package_name(m) != normalize_package_name(p)]
+    found = query_pypi_many(renamed)
+    for module in renamed:
+        if found.get(module):
+            print("Dropping {} -> {}: the index has a {} project".format(module, mapping[module], module))
+            del mapping[module]
+    return mapping
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sources", nargs="*")
+    parser.add_argument("--installed", action="store_true")
+    parser.add_argument("--wheels", metavar="DIR")
+    parser.add_argument("--check-index", action="store_true",
+                        help="drop generated renames shadowing a project on the index")
+    parser.add_argument("--replace", action="store_true",
+                        help="do not merge with the existing table")
+    args = parser.parse_args()
+
+    mapping = {}
+    if not args.replace and os.path.exists(MAP_PATH):
+        mapping.update(read_source(MAP_PATH))
+    generated = {}
+    if args.installed:
+        generated.update(installed_mapping())
+    if args.wheels:
+        generated.update(wheels_mapping(args.wheels))
+    if args.check_index:
+        generated = drop_shadowed(generated)
+    mapping.update(generated)
+    for source in args.sources:
+        mapping.update(read_source(source))
+
+    write_package_map(mapping, MAP_PATH)
+    print("{} entries written to {}".format(len(mapping), MAP_PATH))
+
+
+if __name__ == "__main__":
+    main()
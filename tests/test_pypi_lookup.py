@@ -0,0 +1,81 @@
+"""
+Concurrent package index lookups, against a local stand-in index server.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from miniogre.actions import query_pypi_many
+
+KNOWN_PACKAGES = {"numpy", "pandas", "requests", "flask"}
+DELAY = 0.3  # seconds per request
+HANG = 5  # seconds for the "hang" project
+
+
+class IndexHandler(BaseHTTPRequestHandler):
+    # Serves both /simple/<name>/ and the legacy /pypi/<name>/json layout
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self):
+        parts = [part for part in self.path.split("/") if part]
+        name = parts[1] if len(parts) > 1 else ""
+        time.sleep(HANG if name == "hang" else DELAY)
+        self.send_response(200 if name in KNOWN_PACKAGES else 404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_GET = _respond
+    do_HEAD = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def index_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), IndexHandler)
+    server.daemon_threads = True
+    server.block_on_close = False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["simple", "json"])
+def index(request, index_server, monkeypatch, tmp_path):
+    monkeypatch.setenv("OGRE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("OGRE_INDEX_BACKEND", request.param)
+    monkeypatch.setenv("OGRE_INDEX_URL", index_server + "/simple")
+    monkeypatch.setenv("OGRE_PYPI_URL", index_server)
+    monkeypatch.setenv("OGRE_PYPI_CONCURRENCY", "16")
+    return index_server
+
+
+def test_found_and_not_found(index):
+    results = query_pypi_many(["numpy", "not-a-package", "requests", "numpy"])
+    assert results == {"numpy": "numpy", "not-a-package": None, "requests": "requests"}
+
+
+def test_lookups_run_concurrently(index):
+    names = sorted(KNOWN_PACKAGES) + ["missing-{}".format(i) for i in range(8)]
+    start = time.monotonic()
+    results = query_pypi_many(names)
+    elapsed = time.monotonic() - start
+
+    assert len(results) == len(names)
+    # Close to one request, far from the 12 * DELAY of serial lookups
+    assert elapsed < 4 * DELAY
+
+
+def test_hanging_request_times_out(index, monkeypatch):
+    monkeypatch.setenv("OGRE_PYPI_TIMEOUT", "0.5")
+    start = time.monotonic()
+    results = query_pypi_many(["hang", "flask"])
+    elapsed = time.monotonic() - start
+
+    assert results == {"hang": None, "flask": "flask"}
+    assert elapsed < HANG / 2